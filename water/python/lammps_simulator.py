@@ -20,6 +20,7 @@ class AutoSim:
         from default_parameters import get_parameters
         self.substance = substance.lower()
         self.parameters, self.masses = get_parameters(self.substance)
+        self.path = None            # Directory of the output files of the last simulation
             
     def set_parameters(self, parameters):
         '''
@@ -101,9 +102,76 @@ class AutoSim:
             self.append_type_to_file(name, params, filename)
         
             
-    def modify_shell(self, read_data, input_script, path):
+    def dump_string(self, dump, dump_every):
+        '''
+        Returns the dump commands to insert into the input script. The
+        trajectory is written to ${path}trajectory.dump for text dumps and
+        to ${path}trajectory.bin for binary dumps (LAMMPS chooses the
+        binary format by the .bin suffix).
+        
+        Arguments:
+        ----------
+        dump            {str}       :   Dump format, "text" or "binary"
+        dump_every      {int}       :   Number of timesteps between frames
+        '''
+        extensions = {"text": "dump", "binary": "bin"}
+        if dump not in extensions:
+            raise ValueError("Unknown dump format {}, use 'text' or 'binary'".format(dump))
+        columns = "id type x y z vx vy vz ix iy iz"
+        return ("dump trajectory all custom {} ${{path}}trajectory.{} {}\n".format(
+                    dump_every, extensions[dump], columns) + 
+                "dump_modify trajectory time yes\n")
+        
+    def extend_thermo(self, contents, stress=False, heat_flux=False):
+        '''
+        Adds the columns needed for Green-Kubo transport coefficients to 
+        the thermo_style command of the input script: the volume and the 
+        off-diagonal pressure tensor for the viscosity, and the heat flux 
+        (compute heat/flux) for the thermal conductivity. The heat flux 
+        uses the per-atom virial of compute stress/atom, as the Vashishta
+        pair style does not support centroid/stress/atom, so it is only 
+        approximate for the three-body terms. See post_process.green_kubo.
+        
+        Arguments:
+        ----------
+        contents        {list(str)} :   Lines of the input script, modified in place
+        stress          {bool}      :   Add vol, pxy, pxz and pyz
+        heat_flux       {bool}      :   Add the heat flux c_flux[1-3]
+        '''
+        for i, line in enumerate(contents):
+            if line.startswith("thermo_style"):
+                break
+        else:
+            raise ValueError("No thermo_style command found in the input script.")
+        columns = contents[i].split()
+        if stress:
+            columns += ["vol", "pxy", "pxz", "pyz"]
+        if heat_flux:
+            columns += ["c_flux[1]", "c_flux[2]", "c_flux[3]"]
+        contents[i] = " ".join(columns) + "\n"
+        if heat_flux:
+            contents[i:i] = ["compute ke all ke/atom\n",
+                             "compute pe all pe/atom\n",
+                             "compute stress all stress/atom NULL virial\n",
+                             "compute flux all heat/flux ke pe stress\n"]
+        
+    def modify_shell(self, read_data, input_script, path, dump=None, dump_every=1000,
+                     stress=False, heat_flux=False):
         '''
         Modify shell
+        
+        Arguments:
+        ----------
+        read_data       {str}       :   Initial configuration (LAMMPS data file)
+        input_script    {str}       :   Input script to write
+        path            {str}       :   Directory of the output files
+        dump            {str}       :   Dump format of the trajectory, "text",
+                                        "binary" or None for no dump. Default: None
+        dump_every      {int}       :   Number of timesteps between dumped frames.
+                                        Default: 1000
+        stress          {bool}      :   Write the volume and the off-diagonal pressure
+                                        tensor to the log. Default: False
+        heat_flux       {bool}      :   Write the heat flux to the log. Default: False
         '''
         element_string = ""
         masses = []
@@ -115,6 +183,8 @@ class AutoSim:
         f = open("../lammps/shell.in", "r")
         contents = f.readlines()
         f.close()
+        if stress or heat_flux:
+            self.extend_thermo(contents, stress, heat_flux)
         
         if self.substance == "silica" or self.substance == "sio2":
             contents.insert(4, "variable path string {}\n".format(path))
@@ -124,6 +194,8 @@ class AutoSim:
             contents.insert(8, "pair_coeff * * {} {}\n".format(self.filename, element_string))
             for i in range(len(masses)):
                 contents.insert(9+i, "mass" + 12 * " " + str(i+1) + " " + str(masses[i]) + "\n")
+            if dump is not None:
+                contents.insert(9+len(masses), self.dump_string(dump, dump_every))
 
             f = open(input_script, "w")
             contents = "".join(contents)
@@ -138,6 +210,8 @@ class AutoSim:
             contents.insert(8, "pair_coeff * * {} {}\n".format(self.filename, element_string))
             for i in range(len(masses)):
                 contents.insert(9+i, "mass" + 12 * " " + str(i+1) + " " + str(masses[i]) + "\n")
+            if dump is not None:
+                contents.insert(9+len(masses), self.dump_string(dump, dump_every))
 
             f = open(input_script, "w")
             contents = "".join(contents)
@@ -161,7 +235,11 @@ class AutoSim:
     def simulate(self, read_data="../data/water_lmps.data",
                        lammps_exec="mpirun -n 4 lmp_mpi", 
                        input_script="../lammps/script.in", 
-                       path="../data/"):
+                       path="../data/",
+                       dump=None,
+                       dump_every=1000,
+                       stress=False,
+                       heat_flux=False):
         '''
         Run LAMMPs simulation with the parameters. 
         
@@ -169,25 +247,108 @@ class AutoSim:
         ----------
         where_to_simulate   :   specify where to simulate. Cluster should
                                 be an option.
+        dump                :   dump format of the trajectory, "text", "binary"
+                                or None for no dump. Binary dumps are faster
+                                to write and to read with post_process.Dump.
+        dump_every          :   number of timesteps between dumped frames.
+        stress              :   write the volume and the off-diagonal pressure
+                                tensor to the log, for the viscosity by 
+                                post_process.green_kubo.
+        heat_flux           :   write the heat flux to the log, for the thermal
+                                conductivity by post_process.green_kubo.
         '''
     
-        self.modify_shell(read_data, input_script, path)
+        self.path = path
+        self.modify_shell(read_data, input_script, path, dump, dump_every, stress, heat_flux)
         self.call_lammps(lammps_exec)
         return None
         
-    def estimate_boiling_temperature(self):
+    def boiling_analysis(self, path=None, quantity="Density", method="changepoint"):
         '''
-        Reading LAMMPs log file and finds the boiling point.
+        Reading LAMMPs log file and locating the liquid-vapour transition 
+        in the heat ramp and the cool-down, see post_process.boiling_point.
+        Besides its results, "enthalpy_kJmol" gives the enthalpy of 
+        vaporization in kJ/mol of molecules (three atoms for both water 
+        and silica), NaN if the number of atoms is not in the log.
+        
+        Arguments:
+        ----------
+        path        {str}   :   directory of the log file. Default: path of the 
+                                last simulation
+        quantity    {str}   :   thermo column to find the transition in
+        method      {str}   :   "changepoint" or "derivative"
         '''
-        boiling_temperature=100
-        return boiling_temperature
+        from post_process import boiling_point
+        log = self.read_log(path)
+        results = boiling_point(log, quantity, method=method)
+        heating, cooling = log.ramps()
+        atoms = heating.performance.get("atoms") if heating is not None else None
+        eV2kJmol = 96.485332
+        results["enthalpy_kJmol"] = (float("nan") if atoms is None 
+                                     else results["enthalpy"] / (atoms / 3) * eV2kJmol)
+        return results
         
-    def estimate_boiling_enthalpy(self):
+    def estimate_boiling_temperature(self, path=None, quantity="Density", method="changepoint"):
         '''
-        Reading LAMMPs log file and finds the enthalpy.
+        Reading LAMMPs log file and finds the boiling point from the 
+        heat ramp, as the temperature where the density drops. See 
+        boiling_analysis.
+        
+        Arguments:
+        ----------
+        path        {str}   :   directory of the log file. Default: path of the 
+                                last simulation
+        quantity    {str}   :   thermo column to find the transition in
+        method      {str}   :   "changepoint" or "derivative"
+        '''
+        return self.boiling_analysis(path, quantity, method)["boiling"]
+        
+    def estimate_boiling_enthalpy(self, path=None, quantity="Density", method="changepoint"):
+        '''
+        Reading LAMMPs log file and finds the enthalpy of vaporization in
+        kJ/mol of molecules, from the jump of the enthalpy at the boiling 
+        point of the heat ramp. See boiling_analysis.
+        
+        Arguments:
+        ----------
+        path        {str}   :   directory of the log file. Default: path of the 
+                                last simulation
+        quantity    {str}   :   thermo column to find the transition in
+        method      {str}   :   "changepoint" or "derivative"
+        '''
+        return self.boiling_analysis(path, quantity, method)["enthalpy_kJmol"]
+        
+    def estimate_hysteresis(self, path=None, quantity="Density", method="changepoint"):
+        '''
+        Reading LAMMPs log file and finds the hysteresis of the transition,
+        the boiling point of the heat ramp minus the condensation point of
+        the cool-down. See boiling_analysis.
+        
+        Arguments:
+        ----------
+        path        {str}   :   directory of the log file. Default: path of the 
+                                last simulation
+        quantity    {str}   :   thermo column to find the transition in
+        method      {str}   :   "changepoint" or "derivative"
+        '''
+        return self.boiling_analysis(path, quantity, method)["hysteresis"]
+        
+    def read_log(self, path=None):
+        '''
+        Parse the log file of a simulation, reusing the parsed log as long
+        as the file is unchanged.
+        
+        Arguments:
+        ----------
+        path        {str}   :   directory of the log file. Default: path of the 
+                                last simulation
         '''
-        enthalpy = 10
-        return enthalpy
+        from post_process import Log
+        if path is None:
+            path = self.path
+        if path is None:
+            raise ValueError("No simulation has been run yet, give the path of the log file.")
+        return Log(path + "log.data", cache=True)
         
     def grid_search(self, parameter_span):
         '''
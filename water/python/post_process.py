@@ -7,7 +7,17 @@ is treated by the Dump class, while the latter is treated by the Log class.
 Author: Even Marius Nordhagen
 '''
 
+import io
+import os
+import bz2
+import gzip
+import json
+import lzma
+import zlib
+import struct
+import hashlib
 import numpy as np
+from numpy.lib.recfunctions import structured_to_unstructured
 import matplotlib.pyplot as plt
 plt.style.use("bmh")
 plt.rcParams["font.family"] = "Serif"   # Font
@@ -16,151 +26,2772 @@ class Dump:
     ''' 
     Analyzing dump files, containing particle-specific information. 
     '''
-    def __init__(self, filename, info_lines=9, particle_line=3):
+    def __init__(self, filename, info_lines=9, particle_line=3, lazy=False, cache=None,
+                 workers=None, columns=None, precision=np.float64, sort=False,
+                 memory=2**30):
         '''
         Initializing the class and loading the file.
         
         Arguments:
         ----------
         filename        {str}       : Which dump file to read
-        info_lines      {int}       : Number of lines storing information
-        particle_line   {int}       : The line that gives the number of particles
+        info_lines      {int}       : Number of lines storing information.
+                                      Kept for backwards compatibility, the
+                                      frame headers are parsed directly
+        particle_line   {int}       : The line that gives the number of particles.
+                                      Kept for backwards compatibility
+        lazy            {bool}      : Do not load all frames into memory, but
+                                      stream them from file when needed. Frames
+                                      are located through a sidecar index. Default: False
+        cache           {bool}      : Memory-map a binary cache of the dump instead of 
+                                      parsing it. If True, the cache is built when missing 
+                                      or outdated. If None, an up-to-date cache is used 
+                                      when present. Default: None
+        workers         {int}       : Parse the dump with this many processes. The
+                                      parallel ingest writes into the binary cache,
+                                      so it implies cache=True. Default: None (serial)
+        columns         {list(str)} : Columns to load, named as in the ITEM: ATOMS
+                                      header, e.g. ["id", "type", "x", "y", "z"].
+                                      Default: None (all columns)
+        precision       {dtype}     : Floating point type of the real-valued columns.
+                                      Integer columns (id, type, ...) are stored as 
+                                      int32. Default: np.float64
+        sort            {bool}      : Reorder every frame by atom id, grouped by type,
+                                      such that rows refer to the same atoms in all 
+                                      frames and each species is a contiguous block
+                                      (see Dump.species_view). Requires the id and 
+                                      type columns. Default: False
+        memory          {int}       : Memory budget in bytes for the frames held at 
+                                      once by chunked analyses. Default: 1 GiB
         '''
+        self.filename = filename
+        self.memory = memory
+        self.data = None
+        self._store = None
+        self.selected = None if columns is None else list(columns)
+        self.precision = np.dtype(precision)
+        self.sort = sort
+        self._order = {}
+        self.species = None
+        if workers is not None and cache is None:
+            cache = True
+        if cache is not False and self.open_cache(build=bool(cache), workers=workers):
+            return
+        if lazy:
+            self.load_index()
+            return
         print("Loading data. For large files, this might takes a while.")
-        f = open(filename,'rt')
-        self.particles = int(f.readlines()[particle_line])
-        f.close()
-        num_lines = sum(1 for line in open(filename))
-        length = self.particles + info_lines
-        self.steps = int(num_lines / length)
-        data = []
         from tqdm import tqdm
-        for t in tqdm(range(self.steps)):
-            data.append(np.loadtxt(open(filename,'rt').readlines()[t * length + info_lines: (t+1) * length]))
+        data, timesteps, boxes = [], [], []
+        for timestep, box, atoms in tqdm(self.iter_frames()):
+            data.append(atoms)
+            timesteps.append(timestep)
+            boxes.append(box)
+        if len(set(len(atoms) for atoms in data)) > 1:
+            raise ValueError("The number of particles changes between frames in {}, "
+                             "open it with lazy=True or cache=True.".format(self.filename))
         self.data = np.asarray(data)
+        self.timesteps = np.asarray(timesteps, dtype=np.int64)
+        self.boxes = np.asarray(boxes)
+        self.steps = len(self.data)
+        self.particles = self.data.shape[1]
+        self.columns = list(self.data.dtype.names)
 
+    def iter_frames(self):
+        '''
+        Generator going through the dump file in one sequential pass,
+        yielding one frame at a time. Only a single frame is kept in
+        memory, such that arbitrarily large files can be analyzed. A
+        partially written last frame is ignored.
+        
+        Yields:
+        -------
+        timestep        {int}       : The timestep of the frame
+        box             {ndarray}   : Box bounds, one row per dimension
+        atoms           {ndarray}   : Particle information, one row per particle
+        '''
+        if self._store is not None or _is_binary(self.filename):
+            if self._store is None and not hasattr(self, "offsets"):
+                self.load_index()
+            yield from self.read_frames(range(self.steps))
+            return
+        with _open_dump(self.filename) as f:
+            while True:
+                try:
+                    header = _read_frame_header(f)
+                    if header is None:
+                        break
+                    atoms = _parse_atoms(f, header["natoms"], self._layout(header))
+                    atoms = self._arrange(atoms)
+                except EOFError:
+                    break
+                yield header["timestep"], header["box"], atoms
+
+    def _layout(self, header):
+        ''' Structured dtype and column indices of the selected columns. '''
+        layout = _atom_layout(header["columns"], self.selected, self.precision)
+        self.columns = list(layout[0].names)
+        return layout
+
+    def _arrange(self, atoms):
+        ''' Bring a frame into the canonical order if sorting is enabled. '''
+        if not self.sort:
+            return atoms
+        atoms = _canonical_order(atoms, self._order)
+        self.species = self._order["species"]
+        return atoms
+
+    def species_view(self, atoms, species):
+        '''
+        Zero-copy view of the particles of one type, for sorted dumps. 
+        Works on a single frame as well as on stacked frames.
+        
+        Arguments:
+        ----------
+        atoms           {ndarray}   : Frame(s) as returned by the dump
+        species         {int}       : Particle type
+        '''
+        if self.species is None:
+            raise ValueError("Species views require a dump opened with sort=True.")
+        return atoms[..., self.species[species]]
+
+    def get(self, atoms, names):
+        '''
+        Returns the named columns of one or several frames as a regular
+        array, e.g. dump.get(atoms, ["x", "y", "z"]) for the positions. 
+        Columns of the same type stored next to each other (like x, y, z)
+        are returned as a zero-copy view.
+        
+        Arguments:
+        ----------
+        atoms           {ndarray}   : Frame(s) as returned by the dump
+        names           {list(str)} : Column names
+        '''
+        for name in names:
+            if name not in atoms.dtype.names:
+                raise KeyError("No column named {} found.".format(name))
+        return structured_to_unstructured(atoms[list(names)])
+
+    def load_index(self, rebuild=False):
+        '''
+        Load the frame index of the dump file, containing the byte offset,
+        timestep and number of particles of every frame. The index is built
+        in a single scan of the file and stored next to it (as
+        <filename>.index.npz), such that later opens can reuse it. It is
+        rebuilt automatically when the size or modification time of the
+        dump file changes. For block-compressed dumps (see Dump.compress), 
+        the index also holds the compressed offset of the block containing
+        each frame.
+        
+        Arguments:
+        ----------
+        rebuild         {bool}      : Rebuild the index even if it is up to date. Default: False
+        '''
+        index_file = self.filename + ".index.npz"
+        stat = os.stat(self.filename)
+        index = None
+        if not rebuild and os.path.exists(index_file):
+            try:
+                with np.load(index_file) as stored:
+                    if (stored["size"] == stat.st_size and 
+                        stored["mtime"] == stat.st_mtime_ns):
+                        index = {key: stored[key] for key in stored.files
+                                 if key not in ("size", "mtime")}
+            except (OSError, KeyError, ValueError):
+                index = None
+        if index is None:
+            index = _scan_dump(self.filename)
+            try:
+                np.savez(index_file, size=stat.st_size, mtime=stat.st_mtime_ns, **index)
+            except OSError:
+                pass        # Read-only location, keep the index in memory only
+        self.offsets = index["offsets"]
+        self.timesteps = index["timesteps"]
+        self.natoms = index["natoms"]
+        self._end = int(index["end"])
+        self.blocks = index.get("blocks")
+        self.block_starts = index.get("block_starts")
+        self.steps = len(self.offsets)
+        self.particles = int(self.natoms[0]) if self.steps else 0
+        if self.steps:
+            self._layout(_first_header(self.filename))
+
+    def read_frames(self, steps):
+        '''
+        Generator parsing only the requested frames, by seeking directly
+        to their byte offsets in the dump file.
+        
+        Arguments:
+        ----------
+        steps           {list(int)} : Frames of interest
+        
+        Yields:
+        -------
+        timestep        {int}       : The timestep of the frame
+        box             {ndarray}   : Box bounds, one row per dimension
+        atoms           {ndarray}   : Particle information, one row per particle
+        '''
+        if self._store is not None:
+            for i in steps:
+                yield int(self.timesteps[i]), self.boxes[i], self._stored_frame(i)
+            return
+        if not hasattr(self, "offsets"):
+            self.load_index()
+        steps = list(steps)
+        offsets = self.offsets[steps]
+        blocks = self._block_index(steps)
+        for header, atoms in _read_frames_at(self.filename, offsets, blocks, 
+                                             self.selected, self.precision):
+            self.columns = list(atoms.dtype.names)
+            yield header["timestep"], header["box"], self._arrange(atoms)
+
+    def poll(self):
+        '''
+        Look for frames appended to the dump file since the last poll, for 
+        following simulations that are still running. Only the new part of
+        the file is scanned, starting from the end of the last complete 
+        frame, and a partially written frame is left for the next poll.
+        New frames are added to the index (and to self.data if the dump is
+        loaded into memory), so all analyses see them.
+        
+        Returns:
+        --------
+        new             {range}     : Indices of the new frames
+        '''
+        if self._store is not None:
+            raise ValueError("Cannot follow a cached dump, open it with cache=False.")
+        if not hasattr(self, "offsets"):
+            steps = len(self.data) if self.data is not None else 0
+            self.load_index(rebuild=True)
+            new = range(steps, self.steps)
+        else:
+            index = _scan_dump(self.filename, start=self._end)
+            self.offsets = np.concatenate((self.offsets, index["offsets"]))
+            self.timesteps = np.concatenate((self.timesteps, index["timesteps"]))
+            self.natoms = np.concatenate((self.natoms, index["natoms"]))
+            self._end = int(index["end"])
+            new = range(self.steps, len(self.offsets))
+            self.steps = len(self.offsets)
+        if self.data is not None and len(new):
+            frames = list(self.read_frames(new))
+            self.data = np.concatenate((self.data, np.asarray([frame[2] for frame in frames])))
+            self.boxes = np.concatenate((self.boxes, np.asarray([frame[1] for frame in frames])))
+        return new
+
+    def follow(self, interval=5.0, timeout=None):
+        '''
+        Generator yielding frames as LAMMPS writes them, polling the dump 
+        file every interval seconds. Frames already in the file are 
+        yielded first.
+        
+        Arguments:
+        ----------
+        interval        {float}     : Seconds between polls. Default: 5.0
+        timeout         {float}     : Stop when no new frame has appeared for this
+                                      many seconds. Default: None (never stop)
+        
+        Yields:
+        -------
+        step            {int}       : Index of the frame
+        timestep        {int}       : The timestep of the frame
+        box             {ndarray}   : Box bounds, one row per dimension
+        atoms           {ndarray}   : Particle information, one row per particle
+        '''
+        import time
+        new = range(len(self))
+        last = time.time()
+        while True:
+            for i, (timestep, box, atoms) in zip(new, self.read_frames(new)):
+                yield i, timestep, box, atoms
+            if len(new):
+                last = time.time()
+            elif timeout is not None and time.time() - last >= timeout:
+                return
+            time.sleep(interval)
+            new = self.poll()
+
+    def _block_index(self, steps):
+        ''' Block offsets of the given frames, None unless block-compressed. '''
+        if self.blocks is None:
+            return None
+        return self.blocks[steps], self.block_starts[steps]
+
+    def read_frame(self, step):
+        '''
+        Parse a single frame, returning (timestep, box, atoms).
+        
+        Arguments:
+        ----------
+        step            {int}       : Frame of interest
+        '''
+        return next(self.read_frames([step]))
+
+    def compress(self, destination, frames_per_block=100, level=6):
+        '''
+        Recompress the dump into a block-compressed file. Every block of 
+        frames is written as a separate gzip member, so the result is a 
+        regular .gz file that any gzip tool can read, while the frame index
+        written next to it records where each block starts. Random access
+        then only has to decompress a single block.
+        
+        Arguments:
+        ----------
+        destination         {str}   : Output file, should end with .gz
+        frames_per_block    {int}   : Number of frames per compressed block. Default: 100
+        level               {int}   : Compression level (1-9). Default: 6
+        '''
+        if _is_binary(self.filename):
+            raise ValueError("Only text dumps can be block-compressed.")
+        if not hasattr(self, "offsets"):
+            self.load_index()
+        offsets = self.offsets
+        blocks = np.zeros(self.steps, dtype=np.int64)
+        block_starts = np.zeros(self.steps, dtype=np.int64)
+        with _open_dump(self.filename) as src, open(destination, "wb") as dst:
+            for first in range(0, self.steps, frames_per_block):
+                last = min(first + frames_per_block, self.steps)
+                blocks[first:last] = dst.tell()
+                block_starts[first:last] = offsets[first]
+                src.seek(offsets[first])
+                if last < self.steps:
+                    chunk = src.read(offsets[last] - offsets[first])
+                else:
+                    chunk = src.read()
+                dst.write(gzip.compress(chunk, compresslevel=level, mtime=0))
+        stat = os.stat(destination)
+        np.savez(destination + ".index.npz", size=stat.st_size, mtime=stat.st_mtime_ns,
+                 offsets=offsets, timesteps=self.timesteps, natoms=self.natoms,
+                 end=self._end, blocks=blocks, block_starts=block_starts)
+
+    def _cache_files(self):
+        ''' Filenames of the binary cache and its metadata. '''
+        return self.filename + ".cache.npy", self.filename + ".cache.json"
+
+    def build_cache(self, workers=None):
+        '''
+        Convert the text dump into a binary cache, stored next to the dump 
+        file. The selected columns are stored as a raw .npy array of 
+        frames x particles (or all particles if the number of particles 
+        changes between frames), while timesteps, box bounds and the size
+        and modification time of the dump go into a small json file.
+        
+        With several workers, the file is split at frame boundaries into 
+        byte ranges of similar size that are parsed in a process pool. 
+        Every worker writes its frames straight into the memory-mapped 
+        cache, so only box bounds are sent back to the main process. 
+        Stream-compressed dumps (.gz, .bz2, .xz) cannot be entered in the 
+        middle and are always parsed serially, block-compressed dumps can.
+        
+        Arguments:
+        ----------
+        workers         {int}       : Number of processes. Default: None (serial)
+        '''
+        array_file, meta_file = self._cache_files()
+        stat = os.stat(self.filename)
+        self.load_index()
+        dtype, usecols = self._layout(_first_header(self.filename))
+        if self.sort and not {"id", "type"} <= set(dtype.names):
+            raise KeyError("Sorting requires the id and type columns.")
+        uniform = len(set(self.natoms.tolist())) <= 1
+        if uniform:
+            shape = (self.steps, self.particles)
+        else:
+            shape = (int(self.natoms.sum()),)
+        
+        tmp_file = array_file + ".tmp"
+        store = np.lib.format.open_memmap(tmp_file, mode="w+", dtype=dtype, shape=shape)
+        del store
+        starts = np.concatenate(([0], np.cumsum(self.natoms)))
+        streamed = self.blocks is None and _is_compressed(self.filename)
+        if workers is None or workers <= 1 or self.steps < 2 or streamed:
+            boxes, times = _parse_frame_range(self.filename, tmp_file, self.offsets, starts,
+                                              self.selected, self.precision, 
+                                              self._block_index(slice(None)), self.sort)
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            # Several ranges per worker evens out the load
+            sizes = np.linspace(0, self.offsets[-1], 4 * workers + 1)[1:-1]
+            bounds = np.searchsorted(self.offsets, sizes)
+            bounds = np.unique(np.concatenate(([0], bounds, [self.steps])))
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(_parse_frame_range, self.filename, tmp_file,
+                                           self.offsets[start:stop], starts[start:stop+1],
+                                           self.selected, self.precision,
+                                           self._block_index(slice(start, stop)), self.sort)
+                           for start, stop in zip(bounds[:-1], bounds[1:])]
+                boxes, times = [], []
+                for future in futures:
+                    part_boxes, part_times = future.result()
+                    boxes.extend(part_boxes)
+                    times.extend(part_times)
+        os.replace(tmp_file, array_file)
+        
+        meta = {"size": stat.st_size, 
+                "mtime": stat.st_mtime_ns,
+                "columns": self.columns,
+                "sorted": self.sort,
+                "timesteps": self.timesteps.tolist(),
+                "natoms": self.natoms.tolist(),
+                "boxes": boxes,
+                "times": times}
+        with open(meta_file, "w") as f:
+            json.dump(meta, f)
+
+    def open_cache(self, build=False, workers=None):
+        '''
+        Memory-map the binary cache of the dump file. Returns False if no 
+        up-to-date cache exists (and build is False). A cache is outdated 
+        when the size or modification time of the dump file has changed.
+        
+        Arguments:
+        ----------
+        build           {bool}      : Build the cache when missing or outdated. Default: False
+        workers         {int}       : Number of processes used to build the cache. Default: None
+        '''
+        array_file, meta_file = self._cache_files()
+        stat = os.stat(self.filename)
+        meta = None
+        if os.path.exists(meta_file) and os.path.exists(array_file):
+            with open(meta_file) as f:
+                meta = json.load(f)
+            if (meta["size"] != stat.st_size or meta["mtime"] != stat.st_mtime_ns or
+                meta.get("sorted", False) != self.sort):
+                meta = None
+        if meta is not None:
+            store = np.load(array_file, mmap_mode="r")
+            if not self._cache_matches(store.dtype):
+                meta = None
+        if meta is None:
+            if not build:
+                return False
+            self.build_cache(workers=workers)
+            return self.open_cache()
+        
+        if self.selected is not None:
+            store = store[self.selected]
+        self._store = store
+        self.columns = list(store.dtype.names)
+        self.timesteps = np.asarray(meta["timesteps"], dtype=np.int64)
+        self.natoms = np.asarray(meta["natoms"], dtype=np.int64)
+        self.boxes = np.asarray(meta["boxes"])
+        self.times = meta["times"]
+        self.steps = len(self.timesteps)
+        self.particles = int(self.natoms[0]) if self.steps else 0
+        self._starts = np.concatenate(([0], np.cumsum(self.natoms)))
+        if self._store.ndim == 2:
+            self.data = self._store
+        if self.sort and self.steps:
+            self.species = _species_slices(self._stored_frame(0)["type"])
+        return True
+
+    def _cache_matches(self, dtype):
+        '''
+        Whether a cache of the given dtype holds the requested columns, 
+        all columns of the dump if none are selected.
+        '''
+        selected = self.selected
+        if selected is None:
+            selected = _atom_layout(_first_header(self.filename)["columns"], None, 
+                                    self.precision)[0].names
+        for name in selected:
+            if name not in dtype.names:
+                return False
+            if dtype[name].kind == "f" and dtype[name] != self.precision:
+                return False
+        return True
+
+    def _stored_frame(self, i):
+        ''' Zero-copy view of frame i in the binary cache. '''
+        if self._store.ndim == 2:
+            return self._store[i]
+        return self._store[self._starts[i]:self._starts[i+1]]
+
+    def __len__(self):
+        if self.data is not None:
+            return len(self.data)
+        return self.steps
+
+    def __getitem__(self, key):
+        '''
+        Random access to frames, dump[i], dump[i:j] and dump[::stride]. 
+        For lazy dumps, only the requested frames are parsed. Slices over 
+        frames with equal numbers of particles are stacked into one array,
+        otherwise a list of arrays is returned.
+        '''
+        if self.data is not None:
+            return self.data[key]
+        steps = range(len(self))[key]
+        if isinstance(key, slice):
+            frames = [atoms for timestep, box, atoms in self.read_frames(steps)]
+            if len(set(len(atoms) for atoms in frames)) == 1:
+                return np.asarray(frames)
+            return frames
+        return self.read_frame(steps)[2]
+
+    def iter_chunks(self, steps=None, memory=None):
+        '''
+        Generator yielding the frames in chunks that fit the memory budget,
+        for analyses of trajectories larger than the memory. Frames in a 
+        chunk are stacked, so a chunk never mixes frames with different 
+        numbers of particles.
+        
+        Arguments:
+        ----------
+        steps           {list(int)} : Frames of interest. Default: all frames
+        memory          {int}       : Memory budget in bytes. Default: self.memory
+        
+        Yields:
+        -------
+        steps           {list(int)} : Indices of the frames in the chunk
+        boxes           {ndarray}   : Box bounds of the frames
+        frames          {ndarray}   : Stacked frames, frames x particles
+        '''
+        memory = self.memory if memory is None else memory
+        if self.data is None and self._store is None and not hasattr(self, "offsets"):
+            self.load_index()
+        steps = list(range(len(self))) if steps is None else list(steps)
+        natoms = self.natoms if hasattr(self, "natoms") else np.full(len(self), self.particles)
+        # Estimate of the bytes per particle, 8 per column
+        row_bytes = 8 * len(self.columns)
+        
+        chunk = []
+        for i in steps + [None]:
+            if chunk and (i is None or natoms[i] != natoms[chunk[0]] or 
+                          (len(chunk) + 1) * natoms[i] * row_bytes > memory):
+                if self.data is not None:
+                    yield chunk, self.boxes[chunk], self.data[chunk]
+                else:
+                    frames = list(self.read_frames(chunk))
+                    yield (chunk, np.asarray([frame[1] for frame in frames]), 
+                           np.asarray([frame[2] for frame in frames]))
+                chunk = []
+            if i is not None:
+                chunk.append(i)
+
+    def run(self, analyses, steps=None, memory=None):
+        '''
+        Run several chunked analyses in a single pass over the frames, and
+        return their results. Each analysis only keeps its partial result
+        between chunks (see e.g. Histogram and RadialDistribution).
+        
+        Arguments:
+        ----------
+        analyses        {list}      : Analysis objects with update and result methods
+        steps           {list(int)} : Frames of interest. Default: all frames
+        memory          {int}       : Memory budget in bytes. Default: self.memory
+        '''
+        for chunk, boxes, frames in self.iter_chunks(steps, memory):
+            for analysis in analyses:
+                analysis.update(frames, boxes)
+        return [analysis.result() for analysis in analyses]
+
+    def histogram(self, quantity, bins=100, range=None, steps=None, memory=None):
+        '''
+        Histogram of a column, or of "speed" or "radius", over all frames.
+        See Histogram. Returns the bin edges and the normalized histogram.
+        '''
+        if range is None:
+            range = _quantity_range(self, quantity, steps, memory)
+        return self.run([Histogram(quantity, bins, range)], steps, memory)[0]
+
+    def distribution(self, quantity, bins=100, range=None, types=None, window=None, 
+                     masses=None, units="metal", steps=None, memory=None):
+        '''
+        Distribution of a column, or of "speed" or "radius", in every frame
+        of interest, computed in chunks. See Distribution.
+        
+        Arguments:
+        ----------
+        quantity        {str}       : Column name, "speed" or "radius"
+        bins            {int}       : Number of bins. Default: 100
+        range           {tuple}     : Lower and upper edge of the bins. Default: None
+                                      (range over all frames of interest)
+        types           {list(int)} : Particle types to include. Default: None (all)
+        window          {int}       : Average the distributions over a running window
+                                      of frames. Default: None
+        masses          {dict}      : Type -> mass, to fit the Maxwell-Boltzmann 
+                                      temperature of every frame. Default: None
+        units           {str}       : LAMMPS units of the dump. Default: "metal"
+        steps           {list(int)} : Frames of interest. Default: all frames
+        memory          {int}       : Memory budget in bytes. Default: self.memory
+        
+        Returns:
+        --------
+        results         {dict}      : "edges", "density" (frames x bins), and 
+                                      "temperature" if masses are given
+        '''
+        if range is None:
+            range = _quantity_range(self, quantity, steps, memory)
+        engine = Distribution(quantity, bins, range, types, masses, units)
+        edges, density = self.run([engine], steps, memory)[0]
+        if window is not None:
+            density = running_average(density, window)
+        results = {"edges": edges, "density": density}
+        if masses is not None:
+            results["temperature"] = engine.temperature
+        return results
+
+    def density_profile(self, axis=2, bins=100, types=None, steps=None, memory=None):
+        '''
+        Number density along an axis, averaged over the frames. See 
+        DensityProfile. Returns the bin centers and the density.
+        '''
+        return self.run([DensityProfile(axis, bins, types)], steps, memory)[0]
+
+    def mean_squared_displacement(self, steps=None, memory=None):
+        '''
+        Mean squared displacement with respect to the first frame. See 
+        MeanSquaredDisplacement.
+        '''
+        return self.run([MeanSquaredDisplacement()], steps, memory)[0]
+
+    def frame_times(self, steps=None, dt=None):
+        '''
+        Simulation time of the given frames. Uses the TIME item of the dump
+        (dump_modify time yes) when present, otherwise the timesteps times 
+        dt, assuming a constant timestep.
+        
+        Arguments:
+        ----------
+        steps           {list(int)} : Frames of interest. Default: all frames
+        dt              {float}     : Timestep in time units. Default: None (from the dump)
+        '''
+        if not hasattr(self, "timesteps"):
+            self.load_index()
+        timesteps = self.timesteps if steps is None else self.timesteps[steps]
+        if dt is None:
+            times = getattr(self, "times", None)
+            if times is not None and None not in times:
+                times = np.asarray(times)
+                return times if steps is None else times[steps]
+            if not hasattr(self, "offsets"):
+                self.load_index()
+            ends = [0, self.steps - 1]
+            headers = [header for header, atoms in _read_frames_at(
+                self.filename, self.offsets[ends], self._block_index(ends), self.selected)]
+            if headers[0]["time"] is None:
+                raise ValueError("No TIME in {}, give the timestep dt.".format(self.filename))
+            if self.timesteps[-1] == self.timesteps[0]:
+                return np.full(len(timesteps), headers[0]["time"])
+            dt = (headers[1]["time"] - headers[0]["time"]) / (self.timesteps[-1] - self.timesteps[0])
+            return headers[0]["time"] + (timesteps - self.timesteps[0]) * dt
+        return timesteps * dt
+
+    def diffusion(self, fit=None, dt=None, steps=None, memory=None, groups=8):
+        '''
+        Mean squared displacement averaged over all time origins, and the
+        diffusion coefficient fitted in its linear regime, for all particles 
+        and for every type (e.g. O and H). See MultiOriginMSD and 
+        fit_diffusion. The frames must be equally spaced in time.
+        
+        Arguments:
+        ----------
+        fit             {tuple}     : Time range of the linear regime. Default: None
+                                      (10% to 50% of the longest lag)
+        dt              {float}     : Timestep in time units. Default: None (from the dump)
+        steps           {list(int)} : Frames of interest. Default: all frames
+        memory          {int}       : Memory budget in bytes. Default: self.memory
+        groups          {int}       : Groups per type for the error bars. Default: 8
+        
+        Returns:
+        --------
+        results         {dict}      : "all" and every type -> dict with "time", "msd",
+                                      "D" and "D_err", in length^2/time of the dump units
+        '''
+        times = self.frame_times(steps, dt)
+        spacing = np.diff(times)
+        if len(spacing) and not np.allclose(spacing, spacing[0], rtol=1e-6):
+            raise ValueError("The frames are not equally spaced in time.")
+        memory = self.memory if memory is None else memory
+        engine = MultiOriginMSD(memory, groups)
+        msd = self.run([engine], steps, memory)[0]
+        time = times - times[0]
+        results = {}
+        for species, series in msd.items():
+            group_msd = engine.group_msd.get(species)
+            D, error = fit_diffusion(time, series, fit, group_msd)
+            results[species] = {"time": time, "msd": series, "D": D, "D_err": error}
+        return results
+
+    def velocity_autocorrelation(self, dt=None, window=1024, overlap=0.5, taper="hann",
+                                 steps=None, memory=None):
+        '''
+        Velocity autocorrelation function and vibrational density of states,
+        for all particles and for every type, streamed over the frames in 
+        overlapping windows. See VelocityAutocorrelation. The frames must be
+        equally spaced in time.
+        
+        Arguments:
+        ----------
+        dt              {float}     : Timestep in time units. Default: None (from the dump)
+        window          {int}       : Frames per window. Default: 1024
+        overlap         {float}     : Overlap of consecutive windows. Default: 0.5
+        taper           {str}       : Window function. Default: "hann"
+        steps           {list(int)} : Frames of interest. Default: all frames
+        memory          {int}       : Memory budget in bytes. Default: self.memory
+        
+        Returns:
+        --------
+        results         {dict}      : "time" and "vacf" (by type, "all" for all 
+                                      particles), "frequency" in 1/time (THz in metal
+                                      units) and "vdos" by type in time units
+        '''
+        times = self.frame_times(steps, dt)
+        spacing = np.diff(times)
+        if len(spacing) == 0 or not np.allclose(spacing, spacing[0], rtol=1e-6):
+            raise ValueError("The frames are not equally spaced in time.")
+        memory = self.memory if memory is None else memory
+        engine = VelocityAutocorrelation(window, overlap, taper, memory)
+        vacf, vdos = self.run([engine], steps, memory)[0]
+        interval = spacing[0]
+        return {"time": np.arange(engine.window) * interval, "vacf": vacf,
+                "frequency": np.fft.rfftfreq(engine.window, interval),
+                "vdos": {species: series * interval for species, series in vdos.items()}}
+
+    def radial_distribution(self, rmax, bins=200, pairs=None, names=None, steps=None, memory=None):
+        '''
+        Radial distribution function averaged over the frames, in total 
+        and optionally partial, e.g. pairs=[("O", "O"), ("O", "H"), ("H", "H")]
+        with names={"H": 1, "O": 2}. See RadialDistribution. Returns the bin 
+        centers and g(r), or a dict of g(r) by pair if pairs are given.
+        '''
+        return self.run([RadialDistribution(rmax, bins, pairs, names)], steps, memory)[0]
+
+
+    def plot_position_distribution(self, steps=[0], show=False, save=False, bins=100):
+        '''
+        Plots a histogram of the radius of the particles. 
+        
+        Arguments:
+        ----------
+        steps           {list}      : The timesteps of interest
+        show            {bool}      : Show plot yes/no (True/False). Default: False
+        save            {bool}      : Save plot yes/no (True/False). Default: False
+        bins            {int}       : Number of bins. Default: 100
+        '''
+        results = self.distribution("radius", bins, steps=steps)
+        for i, density in zip(steps, results["density"]):
+            plt.figure()
+            plt.stairs(density, results["edges"], fill=True, facecolor='b', alpha=0.75)
+            plt.xlabel('Radius')
+            plt.ylabel('Density')
+            plt.grid()
+            if save: plt.savefig('../fig/position_distribution_{}.png'.format(i))
+            if show: plt.show()
+        return results
+
+    def plot_velocity_distribution(self, steps=[0], show=False, save=False, bins=100, 
+                                   masses=None, units="metal"):
+        '''
+        Plots a histogram of the speed of all particles at selected timesteps.
+        Given the masses of the types, the fitted Maxwell-Boltzmann 
+        distribution is shown along.
+        
+        Arguments:
+        ----------
+        steps           {list(int)} : The timesteps of interest
+        show            {bool}      : Show plot yes/no (True/False). Default: False
+        save            {bool}      : Save plot yes/no (True/False). Default: False
+        bins            {int}       : Number of bins. Default: 100
+        masses          {dict}      : Type -> mass. Default: None
+        units           {str}       : LAMMPS units of the dump. Default: "metal"
+        '''
+        results = self.distribution("speed", bins, steps=steps, masses=masses, units=units)
+        edges = results["edges"]
+        for j, (i, density) in enumerate(zip(steps, results["density"])):
+            plt.figure()
+            plt.stairs(density, edges, fill=True, facecolor='b', alpha=0.75)
+            if masses is not None:
+                # Mixture of the distributions of every type
+                types, counts = np.unique(self[i]["type"], return_counts=True)
+                speed = np.linspace(edges[0], edges[-1], 200)
+                temperature = results["temperature"][j]
+                fit = sum(count * maxwell_boltzmann(speed, temperature, masses[t], units)
+                          for t, count in zip(types, counts)) / counts.sum()
+                plt.plot(speed, fit, label="Maxwell-Boltzmann, T = {:.1f}".format(temperature))
+                plt.legend(loc="best")
+            plt.xlabel('Speed')
+            plt.ylabel('Density')
+            plt.grid()
+            if save: plt.savefig('../fig/velocity_distribution_{}.png'.format(i))
+            if show: plt.show()
+        return results
+            
+    def plot_diffusion(self, show=False, save=False, fit=None, dt=None):
+        '''
+        Plot the mean squared displacement of every type and estimate the 
+        diffusion constants, see Dump.diffusion.
+        
+        Arguments:
+        ----------
+        show            {bool}      : Show plot yes/no (True/False). Default: False
+        save            {bool}      : Save plot yes/no (True/False). Default: False
+        fit             {tuple}     : Time range of the linear regime. Default: None
+        dt              {float}     : Timestep in time units. Default: None (from the dump)
+        '''
+        results = self.diffusion(fit, dt)
+        for species, result in results.items():
+            label = "All" if species == "all" else "Type {}".format(species)
+            plt.plot(result["time"], result["msd"], label=label)
+            print("{}: D = {:.4g} +- {:.2g}".format(label, result["D"], result["D_err"]))
+        plt.xlabel("Time")
+        plt.ylabel("MSD")
+        plt.legend(loc="best")
+        if save: plt.savefig("../fig/diffusion.png")
+        if show: plt.show()
+        return results
+        
+    def plot_radial(self, show=False, save=False, rmax=None, bins=200, pairs=None, names=None):
+        '''
+        Plot the radial distribution function as a function of relative distance.
+        
+        Arguments:
+        ----------
+        show            {bool}      : Show plot yes/no (True/False). Default: False
+        save            {bool}      : Save plot yes/no (True/False). Default: False
+        rmax            {float}     : Largest distance. Default: None (half the box length)
+        bins            {int}       : Number of bins. Default: 200
+        pairs           {list}      : Pairs of types for partial g(r). Default: None
+        names           {dict}      : Name -> type. Default: None
+        '''
+        if rmax is None:
+            timestep, box, atoms = self.read_frame(0)
+            rmax = (box[:, 1] - box[:, 0]).min() / 2
+        r, g = self.radial_distribution(rmax, bins, pairs, names)
+        if pairs is None:
+            g = {"all": g}
+        for pair, series in g.items():
+            plt.plot(r, series, label="All" if pair == "all" else "-".join(map(str, pair)))
+        plt.xlabel("Distance")
+        plt.ylabel("g(r)")
+        plt.legend(loc="best")
+        if save: plt.savefig("../fig/radial.png")
+        if show: plt.show()
+        return r, g
+
+
+class Histogram:
+    ''' 
+    Chunked histogram of a per-particle quantity over many frames. The
+    bins are fixed, such that partial histograms of every chunk can be 
+    added together. Values outside the range count in the normalization.
+    '''
+    def __init__(self, quantity, bins, range):
+        '''
+        Arguments:
+        ----------
+        quantity        {str}       : Column name, "speed" or "radius"
+        bins            {int}       : Number of bins
+        range           {tuple}     : Lower and upper edge of the bins
+        '''
+        self.quantity = quantity
+        self.edges = np.linspace(range[0], range[1], bins + 1)
+        self.counts = np.zeros(bins, dtype=np.int64)
+        self.total = 0
+
+    def update(self, frames, boxes):
+        bins = len(self.counts)
+        index = _bin_index(_quantity(frames, self.quantity).ravel(), self.edges)
+        self.counts += np.bincount(index, minlength=bins + 1)[:bins]
+        self.total += len(index)
+
+    def result(self):
+        widths = np.diff(self.edges)
+        return self.edges, self.counts / max(self.total, 1) / widths
+
+
+class Distribution:
+    '''
+    Chunked distribution of a per-particle quantity in every frame, with
+    fixed bins. All frames of a chunk are binned by a single bincount. 
+    Every frame is normalized by its number of included particles, also 
+    counting those outside the range. Given the masses of the types, the temperature of every frame is also 
+    fitted to the Maxwell-Boltzmann distribution of the velocities.
+    '''
+    def __init__(self, quantity, bins, range, types=None, masses=None, units="metal"):
+        '''
+        Arguments:
+        ----------
+        quantity        {str}       : Column name, "speed" or "radius"
+        bins            {int}       : Number of bins
+        range           {tuple}     : Lower and upper edge of the bins
+        types           {list(int)} : Particle types to include. Default: None (all)
+        masses          {dict}      : Type -> mass, to fit temperatures. Default: None
+        units           {str}       : LAMMPS units of the dump. Default: "metal"
+        '''
+        if units not in UNITS:
+            raise KeyError("No units named {} found.".format(units))
+        self.quantity = quantity
+        self.edges = np.linspace(range[0], range[1], bins + 1)
+        self.types = types
+        self.masses = masses
+        self.units = units
+        self.counts = []
+        self.totals = []
+        self.temperatures = []
+
+    def update(self, frames, boxes):
+        bins = len(self.edges) - 1
+        frames = np.atleast_2d(frames)
+        index = _bin_index(_quantity(frames, self.quantity), self.edges)
+        if self.types is not None:
+            included = np.isin(frames["type"], self.types)
+            index[~included] = bins
+            self.totals.append(np.count_nonzero(included, axis=1))
+        else:
+            self.totals.append(np.full(len(frames), frames.shape[1]))
+        # Bin every frame in its own block, bin "bins" collects the rest
+        index += (bins + 1) * np.arange(len(frames))[:, None]
+        counts = np.bincount(index.ravel(), minlength=len(frames) * (bins + 1))
+        self.counts.append(counts.reshape(len(frames), bins + 1)[:, :bins])
+        if self.masses is not None:
+            self.temperatures.append(_temperature(frames, self.masses, self.units, self.types))
+
+    def result(self):
+        '''
+        Returns the bin edges and the normalized distribution of every 
+        frame, frames x bins. The fitted temperatures are found in 
+        Distribution.temperature.
+        '''
+        counts = np.concatenate(self.counts) if self.counts else np.zeros((0, len(self.edges) - 1))
+        if self.masses is not None:
+            self.temperature = np.concatenate(self.temperatures)
+        totals = np.concatenate(self.totals) if self.totals else np.zeros(0)
+        totals = np.maximum(totals, 1)[:, None]
+        return self.edges, counts / totals / np.diff(self.edges)
+
+
+# Conversion of mass times velocity squared to energy, and the Boltzmann 
+# constant, in LAMMPS units
+UNITS = {"metal": {"mvv2e": 1.0364269e-4, "boltz": 8.617343e-5},
+         "real": {"mvv2e": 48.88821291**2, "boltz": 0.0019872067},
+         "lj": {"mvv2e": 1.0, "boltz": 1.0},
+         "si": {"mvv2e": 1.0, "boltz": 1.3806504e-23}}
+
+
+def _temperature(frames, masses, units="metal", types=None):
+    '''
+    Maximum likelihood temperature of the Maxwell-Boltzmann distribution 
+    of the velocities, kT = <m v^2> / 3, of every stacked frame.
+    
+    Arguments:
+    ----------
+    frames          {ndarray}   : Stacked frames, frames x particles
+    masses          {dict}      : Type -> mass
+    units           {str}       : LAMMPS units. Default: "metal"
+    types           {list(int)} : Particle types to include. Default: None (all)
+    '''
+    lookup = np.zeros(max(masses) + 1)
+    for t, mass in masses.items():
+        lookup[t] = mass
+    mass = lookup[frames["type"]]
+    if types is not None:
+        mass = np.where(np.isin(frames["type"], types), mass, 0)
+    velocity = structured_to_unstructured(frames[["vx", "vy", "vz"]])
+    kinetic = np.einsum('fj,fjk,fjk->f', mass, velocity, velocity)
+    count = np.count_nonzero(mass, axis=1)
+    return UNITS[units]["mvv2e"] * kinetic / (3 * np.maximum(count, 1) * UNITS[units]["boltz"])
+
+
+def maxwell_boltzmann(speed, temperature, mass, units="metal"):
+    '''
+    Maxwell-Boltzmann distribution of the speed of particles of the given 
+    mass at the given temperature.
+    
+    Arguments:
+    ----------
+    speed           {ndarray}   : Speeds
+    temperature     {float}     : Temperature in K (or LJ units)
+    mass            {float}     : Mass of the particles
+    units           {str}       : LAMMPS units. Default: "metal"
+    '''
+    a = UNITS[units]["mvv2e"] * mass / (UNITS[units]["boltz"] * temperature)
+    return np.sqrt(2 / np.pi) * a**1.5 * speed**2 * np.exp(-a * speed**2 / 2)
+
+
+def running_average(series, window):
+    '''
+    Running average over the last window entries along the first axis,
+    computed with cumulative sums. The first entries average over the 
+    entries available.
+    
+    Arguments:
+    ----------
+    series          {ndarray}   : Values, frames first
+    window          {int}       : Number of entries to average over
+    '''
+    series = np.asarray(series, dtype=float)
+    total = np.cumsum(series, axis=0)
+    total[window:] = total[window:] - total[:-window]
+    counts = np.minimum(np.arange(1, len(series) + 1), window)
+    return total / counts.reshape((-1,) + (1,) * (series.ndim - 1))
+
+
+def _bin_index(values, edges):
+    '''
+    Bin of every value in uniform bins, len(edges) - 1 if outside. The 
+    upper edge belongs to the last bin.
+    '''
+    bins = len(edges) - 1
+    index = np.floor((values - edges[0]) / (edges[-1] - edges[0]) * bins)
+    index[values == edges[-1]] = bins - 1
+    index[~((index >= 0) & (index < bins))] = bins
+    return index.astype(np.int64)
+
+
+class DensityProfile:
+    ''' Chunked number density profile along one of the box axes. '''
+    def __init__(self, axis=2, bins=100, types=None):
+        '''
+        Arguments:
+        ----------
+        axis            {int}       : Axis of the profile (0, 1 or 2). Default: 2
+        bins            {int}       : Number of bins across the box. Default: 100
+        types           {list(int)} : Particle types to include. Default: None (all)
+        '''
+        self.axis = axis
+        self.bins = bins
+        self.types = types
+        self.counts = np.zeros(bins)
+        self.lengths = []
+        self.frames = 0
+        self.volume = 0
+
+    def update(self, frames, boxes):
+        pos = _positions(frames, boxes)[..., self.axis]
+        lo = boxes[:, self.axis, 0][:, None]
+        length = (boxes[:, self.axis, 1] - boxes[:, self.axis, 0])[:, None]
+        # Fractional coordinates, such that fluctuating (NPT) boxes share bins
+        index = (np.mod((pos - lo) / length, 1) * self.bins).astype(np.int64)
+        if self.types is not None:
+            index = index[np.isin(frames["type"], self.types)]
+        self.counts += np.bincount(index.ravel(), minlength=self.bins)
+        self.lengths.extend(length.ravel())
+        bin_volumes = np.prod(boxes[:, :, 1] - boxes[:, :, 0], axis=1) / self.bins
+        self.volume += bin_volumes.sum()
+        self.frames += len(frames)
+
+    def result(self):
+        length = np.mean(self.lengths)
+        centers = (np.arange(self.bins) + 0.5) * length / self.bins
+        return centers, self.counts / self.volume
+
+
+class MeanSquaredDisplacement:
+    '''
+    Chunked mean squared displacement with respect to the first frame.
+    Only the reference and the previous positions are kept between 
+    chunks. Positions are unwrapped with image flags when present, 
+    otherwise by the minimum image convention between consecutive frames.
+    '''
+    def __init__(self):
+        self.msd = []
+        self._state = {}
+        self._reference = None
+
+    def update(self, frames, boxes):
+        for atoms, box in zip(frames, boxes):
+            pos = _unwrap(atoms, box, self._state)
+            if self._reference is None:
+                self._reference = pos
+            diff = pos - self._reference
+            self.msd.append(np.einsum('jk,jk->', diff, diff) / len(diff))
+
+    def result(self):
+        return np.asarray(self.msd)
+
+
+class MultiOriginMSD:
+    '''
+    Mean squared displacement averaged over all time origins, for all 
+    particles and for every particle type. The frames must be equally 
+    spaced in time and contain the same particles.
+    
+    While going through the frames, the unwrapped positions are written 
+    to a temporary file. The average over origins is then computed with 
+    FFTs in O(T log T) per particle (Calandrini et al., 2011), reading 
+    back the whole trajectory of a batch of particles at a time, such 
+    that memory is bounded for large systems. The particles of every 
+    type are also split into groups, whose independent MSDs give the 
+    error bars of the diffusion coefficient (see fit_diffusion).
+    '''
+    def __init__(self, memory=2**28, groups=8):
+        '''
+        Arguments:
+        ----------
+        memory          {int}       : Memory budget of a batch of particles in bytes.
+                                      Default: 256 MiB
+        groups          {int}       : Number of groups per type. Default: 8
+        '''
+        import tempfile
+        self.memory = memory
+        self.groups = groups
+        self.frames = 0
+        self.types = None
+        self._state = {}
+        self._file = tempfile.TemporaryFile()
+
+    def update(self, frames, boxes):
+        for atoms, box in zip(frames, boxes):
+            pos = _unwrap(atoms, box, self._state)
+            if self.types is None:
+                self.types = _sorted_types(atoms, self._state)
+            elif len(pos) != len(self.types):
+                raise ValueError("The number of particles changes between frames.")
+            self._file.write(np.ascontiguousarray(pos, dtype=np.float64).tobytes())
+            self.frames += 1
+
+    def result(self):
+        '''
+        Returns:
+        --------
+        msd             {dict}      : "all" and every type -> MSD at lags 0, 1, ...,
+                                      frames-1 in units of the frame spacing
+        '''
+        if self.frames == 0:
+            raise ValueError("No frames given.")
+        self._file.flush()
+        positions = np.memmap(self._file, dtype=np.float64, mode="r", 
+                              shape=(self.frames, len(self.types), 3))
+        batch = max(1, self.memory // (200 * self.frames))
+        sums, counts = {}, {}
+        for species, block in _species_slices(self.types).items():
+            bounds = np.linspace(block.start, block.stop, self.groups + 1).astype(int)
+            sums[species] = np.zeros((self.groups, self.frames))
+            for g, (first, last) in enumerate(zip(bounds[:-1], bounds[1:])):
+                for start in range(first, last, batch):
+                    sums[species][g] += _msd_fft(positions[:, start:min(start + batch, last)])
+            counts[species] = np.diff(bounds)
+        del positions
+        self._file.close()
+        sums["all"] = sum(sums.values())
+        counts["all"] = sum(counts.values())
+        
+        msd = {}
+        self.group_msd = {}
+        for species in sums:
+            nonempty = counts[species] > 0
+            msd[species] = sums[species].sum(axis=0) / counts[species].sum()
+            self.group_msd[species] = (sums[species][nonempty] / counts[species][nonempty, None],
+                                       counts[species][nonempty])
+        return msd
+
+
+class VelocityAutocorrelation:
+    '''
+    Velocity autocorrelation function (VACF) and vibrational density of 
+    states (VDOS), for all particles and for every particle type, 
+    streamed over the frames in overlapping windows (Welch's method). 
+    Only one window of velocities is kept in memory. Within every window
+    the VACF is averaged over all time origins with zero-padded FFTs, and 
+    the VDOS is the power spectrum of the tapered velocities. The frames
+    must be equally spaced in time and contain the same particles.
+    '''
+    def __init__(self, window=1024, overlap=0.5, taper="hann", memory=2**28):
+        '''
+        Arguments:
+        ----------
+        window          {int}       : Frames per window, the longest VACF lag and the 
+                                      frequency resolution. Default: 1024
+        overlap         {float}     : Overlap of consecutive windows. Default: 0.5
+        taper           {str}       : Window function, "hann", "hamming", "blackman" 
+                                      or "boxcar". Default: "hann"
+        memory          {int}       : Memory budget of the FFTs in bytes. Default: 256 MiB
+        '''
+        tapers = {"hann": np.hanning, "hamming": np.hamming, "blackman": np.blackman,
+                  "boxcar": np.ones}
+        if taper not in tapers:
+            raise KeyError("No taper named {} found.".format(taper))
+        self.window = window
+        self.hop = max(1, int(round(window * (1 - overlap))))
+        self.taper = tapers[taper]
+        self.memory = memory
+        self.windows = 0
+        self.types = None
+        self._state = {}
+        self._buffer = None
+        self._filled = 0
+        self._acf = {}
+        self._psd = {}
+        self._origins = 0
+
+    def update(self, frames, boxes):
+        for atoms, box in zip(frames, boxes):
+            if "id" in atoms.dtype.names:
+                atoms = _canonical_order(atoms, self._state.setdefault("order", {}))
+            if not {"vx", "vy", "vz"} <= set(atoms.dtype.names):
+                raise KeyError("No velocity columns found.")
+            if self._buffer is None:
+                self.types = _sorted_types(atoms, self._state)
+                self._buffer = np.empty((self.window, len(atoms), 3))
+            elif len(atoms) != len(self.types):
+                raise ValueError("The number of particles changes between frames.")
+            self._buffer[self._filled] = structured_to_unstructured(atoms[["vx", "vy", "vz"]])
+            self._filled += 1
+            if self._filled == self.window:
+                self._transform(self._buffer)
+                # Keep the overlapping part for the next window
+                keep = self.window - self.hop
+                self._buffer[:keep] = self._buffer[self.hop:]
+                self._filled = keep
+
+    def _transform(self, velocities):
+        ''' Add the VACF and power spectrum of a window, a batch of particles at a time. '''
+        W = len(velocities)
+        taper = self.taper(W)[:, None, None]
+        batch = max(1, self.memory // (100 * W))
+        for species, block in _species_slices(self.types).items():
+            acf = np.zeros(W)
+            psd = np.zeros(W // 2 + 1)
+            for start in range(block.start, block.stop, batch):
+                v = velocities[:, start:min(start + batch, block.stop)]
+                F = np.fft.rfft(v, n=2*W, axis=0)
+                acf += np.fft.irfft(np.einsum('tjk->t', F.real**2 + F.imag**2), n=2*W)[:W]
+                F = np.fft.rfft(v * taper, axis=0)
+                psd += np.einsum('tjk->t', F.real**2 + F.imag**2)
+            self._acf[species] = self._acf.get(species, 0) + acf
+            self._psd[species] = self._psd.get(species, 0) + psd / (taper**2).sum()
+        self._origins = self._origins + (W - np.arange(W))
+        self.windows += 1
+
+    def result(self):
+        '''
+        Returns:
+        --------
+        vacf            {dict}      : "all" and every type -> VACF per particle at 
+                                      lags 0, 1, ..., window-1 frames
+        vdos            {dict}      : "all" and every type -> VDOS at the frequencies
+                                      np.fft.rfftfreq(window), in cycles per frame, 
+                                      normalised to unit area
+        '''
+        if self.windows == 0:
+            if self._filled < 2:
+                raise ValueError("At least two frames are needed.")
+            # Fewer frames than a window, use them all as a single window
+            self.window = self._filled
+            self._transform(self._buffer[:self._filled])
+        self._buffer = None
+        counts = {species: block.stop - block.start 
+                  for species, block in _species_slices(self.types).items()}
+        self._acf["all"] = sum(self._acf.values())
+        self._psd["all"] = sum(self._psd.values())
+        counts["all"] = len(self.types)
+        vacf, vdos = {}, {}
+        for species in self._acf:
+            vacf[species] = self._acf[species] / (self._origins * counts[species])
+            # Bins are 1/window apart, the end bins only cover half a bin
+            area = self._psd[species].sum() - 0.5 * (self._psd[species][0] + self._psd[species][-1])
+            vdos[species] = self._psd[species] * self.window / area
+        return vacf, vdos
+
+
+class RadialDistribution:
+    '''
+    Chunked radial distribution function of orthogonal periodic boxes, in 
+    total and optionally partial between pairs of types (e.g. O-O, O-H 
+    and H-H, or Si-O). The pairs within rmax are found with a periodic 
+    k-d tree, so that memory scales with the number of particles times
+    the number of neighbors rather than the number of particles squared.
+    '''
+    def __init__(self, rmax, bins=200, pairs=None, names=None):
+        '''
+        Arguments:
+        ----------
+        rmax            {float}     : Largest distance, at most half the box length
+        bins            {int}       : Number of bins. Default: 200
+        pairs           {list}      : Pairs of types to compute partial g(r) for, e.g.
+                                      [(2, 2), (2, 1), (1, 1)]. Default: None (only total)
+        names           {dict}      : Name -> type, such that pairs can be given by name, 
+                                      e.g. {"H": 1, "O": 2}. Default: None
+        '''
+        self.edges = np.linspace(0, rmax, bins + 1)
+        self.pairs = pairs
+        self.names = {} if names is None else names
+        self.counts = {"all": np.zeros(bins)}
+        for pair in pairs or []:
+            self.counts[tuple(pair)] = np.zeros(bins)
+        self.frames = 0
+
+    def update(self, frames, boxes):
+        from scipy.spatial import cKDTree
+        rmax = self.edges[-1]
+        bins = len(self.edges) - 1
+        shells = 4 / 3 * np.pi * np.diff(self.edges**3)
+        for atoms, box in zip(frames, boxes):
+            length = box[:, 1] - box[:, 0]
+            if rmax > length.min() / 2:
+                raise ValueError("rmax is larger than half the box length {}.".format(length.min()))
+            volume = np.prod(length)
+            pos = np.mod(_positions(atoms, box) - box[:, 0], length)
+            tree = cKDTree(pos, boxsize=length)
+            pairs = tree.query_pairs(rmax, output_type="ndarray")
+            diff = pos[pairs[:, 0]] - pos[pairs[:, 1]]
+            diff -= length * np.round(diff / length)
+            index = (np.sqrt(np.einsum('ij,ij->i', diff, diff)) * (bins / rmax)).astype(np.intp)
+            index = np.minimum(index, bins - 1)
+            n = len(pos)
+            if not self.pairs:
+                counts = np.bincount(index, minlength=bins)
+            else:
+                if "type" not in atoms.dtype.names:
+                    raise KeyError("Partial g(r) requires the type column.")
+                # Histogram of every unordered pair of types in a single pass
+                types = np.asarray(atoms["type"], dtype=np.intp)
+                ntypes = types.max() + 1
+                first, second = types[pairs[:, 0]], types[pairs[:, 1]]
+                kind = np.minimum(first, second) * ntypes + np.maximum(first, second)
+                partial = np.bincount(kind * bins + index, minlength=ntypes * ntypes * bins)
+                partial = partial.reshape(ntypes, ntypes, bins)
+                counts = partial.sum(axis=(0, 1))
+                numbers = np.bincount(types, minlength=ntypes)
+                for pair in self.pairs:
+                    a, b = sorted(self.names.get(name, name) for name in pair)
+                    if b >= ntypes:
+                        continue
+                    if a == b:
+                        norm = numbers[a] * (numbers[a] - 1) / 2
+                    else:
+                        norm = numbers[a] * numbers[b]
+                    if norm > 0:
+                        self.counts[tuple(pair)] += partial[a, b] * volume / (norm * shells)
+            # Every pair is found once, but counts for both of its particles
+            self.counts["all"] += 2 * counts * volume / (n * (n - 1) * shells)
+            self.frames += 1
+
+    def result(self):
+        '''
+        Returns the bin centers and g(r), or a dict with the total g(r) as
+        "all" and the partial ones by pair if pairs were given.
+        '''
+        centers = 0.5 * (self.edges[1:] + self.edges[:-1])
+        g = {pair: counts / max(self.frames, 1) for pair, counts in self.counts.items()}
+        if self.pairs is None:
+            return centers, g["all"]
+        return centers, g
+
+
+def read_data(filename):
+    '''
+    Read the box and the atoms of a LAMMPS data file, for instance the 
+    snapshots written by write_data. The atom style is taken from the 
+    comment after "Atoms" or guessed from the number of columns (atomic,
+    charge or full, optionally followed by image flags). Only orthogonal 
+    boxes are supported.
+    
+    Arguments:
+    ----------
+    filename        {str}       : LAMMPS data file
+    
+    Returns:
+    --------
+    box             {ndarray}   : Box bounds, one row per dimension
+    atoms           {ndarray}   : Particle information like a frame of Dump
+    '''
+    styles = {"atomic": ["id", "type", "x", "y", "z"],
+              "charge": ["id", "type", "q", "x", "y", "z"],
+              "full": ["id", "mol", "type", "q", "x", "y", "z"]}
+    with open(filename) as f:
+        lines = f.readlines()
+    box = np.zeros((3, 2))
+    natoms = None
+    for i, line in enumerate(lines[1:], 1):
+        words = line.split("#")[0].split()
+        if len(words) == 2 and words[1] == "atoms":
+            natoms = int(words[0])
+        elif len(words) == 4 and words[2:] in (["xlo", "xhi"], ["ylo", "yhi"], ["zlo", "zhi"]):
+            box["xyz".index(words[2][0])] = float(words[0]), float(words[1])
+        elif words and words[0] == "Atoms":
+            break
+    else:
+        raise ValueError("No Atoms section found in {}.".format(filename))
+    if natoms is None:
+        raise ValueError("Number of atoms not found in {}.".format(filename))
+    start = i + 1
+    while not lines[start].strip():
+        start += 1
+    body = lines[start:start + natoms]
+    ncolumns = len(body[0].split("#")[0].split())
+    style = line.split("#")[1].strip() if "#" in line else None
+    if style not in styles:
+        style = {5: "atomic", 8: "atomic", 6: "charge", 9: "charge", 7: "full", 10: "full"}.get(ncolumns)
+        if style is None:
+            raise ValueError("Unknown atom style with {} columns in {}.".format(ncolumns, filename))
+    columns = styles[style]
+    if ncolumns == len(columns) + 3:
+        columns = columns + ["ix", "iy", "iz"]
+    dtype, usecols = _atom_layout(columns)
+    atoms = np.loadtxt(body, dtype=dtype, usecols=usecols, comments="#", ndmin=1)
+    return box, atoms
+
+
+def snapshot_radial_distribution(filenames, rmax, bins=200, pairs=None, names=None):
+    '''
+    Radial distribution function averaged over LAMMPS data files, such as
+    the write_data snapshots of a simulation (see Segment.write_data). 
+    See RadialDistribution.
+    
+    Arguments:
+    ----------
+    filenames       {list(str)} : LAMMPS data files
+    rmax            {float}     : Largest distance, at most half the box length
+    bins            {int}       : Number of bins. Default: 200
+    pairs           {list}      : Pairs of types for partial g(r). Default: None
+    names           {dict}      : Name -> type. Default: None
+    '''
+    rdf = RadialDistribution(rmax, bins, pairs, names)
+    for filename in filenames:
+        box, atoms = read_data(filename)
+        rdf.update([atoms], [box])
+    return rdf.result()
+
+
+def _unwrap(atoms, box, state):
+    '''
+    Unwrapped positions of a frame in canonical order. Image flags or 
+    unwrapped coordinates are used when present, otherwise positions are
+    unwrapped by the minimum image convention between consecutive frames,
+    so the frames have to be passed in order.
+    
+    Arguments:
+    ----------
+    atoms           {ndarray}   : Frame as returned by Dump
+    box             {ndarray}   : Box bounds of the frame
+    state           {dict}      : Kept between frames, start with an empty dict
+    '''
+    if "id" in atoms.dtype.names:
+        atoms = _canonical_order(atoms, state.setdefault("order", {}))
+    pos, unwrapped = _positions(atoms, box, unwrap=True)
+    previous = state.get("previous")
+    if not unwrapped and previous is not None:
+        length = box[:, 1] - box[:, 0]
+        step = pos - previous
+        step -= length * np.round(step / length)
+        state["previous"] = pos
+        pos = state["unwrapped"] + step
+    else:
+        state["previous"] = pos
+    state["unwrapped"] = pos
+    return pos
+
+
+def _sorted_types(atoms, state):
+    ''' Types of a frame in the canonical order used by _unwrap. '''
+    if "type" not in atoms.dtype.names:
+        return np.zeros(len(atoms), dtype=np.int32)
+    if "id" in atoms.dtype.names:
+        atoms = _canonical_order(atoms, state.setdefault("order", {}))
+    return np.array(atoms["type"])
+
+
+def _msd_fft(pos):
+    '''
+    Mean squared displacement summed over particles, averaged over all 
+    time origins: MSD(m) = S1(m) - 2 S2(m), where S1 follows from the 
+    squared positions by cumulative sums and the position autocorrelation
+    S2 from zero-padded FFTs.
+    
+    Arguments:
+    ----------
+    pos             {ndarray}   : Unwrapped positions, frames x particles x 3
+    '''
+    T = len(pos)
+    pos = np.asarray(pos, dtype=np.float64)
+    D = np.einsum('tjk,tjk->t', pos, pos)
+    left = np.concatenate(([0], np.cumsum(D[:-1])))
+    right = np.concatenate(([0], np.cumsum(D[::-1][:-1])))
+    counts = T - np.arange(T)
+    S1 = (2 * D.sum() - left - right) / counts
+    F = np.fft.rfft(pos, n=2*T, axis=0)
+    power = np.einsum('tjk->t', F.real**2 + F.imag**2)
+    S2 = np.fft.irfft(power, n=2*T)[:T] / counts
+    return S1 - 2 * S2
+
+
+def fit_diffusion(time, msd, fit=None, group_msd=None, dimensions=3):
+    '''
+    Diffusion coefficient from the slope of the MSD in a linear regime, 
+    MSD = 2 d D t + b. The error is the standard error of D fitted to the
+    MSDs of independent groups of particles when group_msd is given, 
+    otherwise the standard error of the least squares slope, which 
+    underestimates it since the MSD points are correlated.
+    
+    Arguments:
+    ----------
+    time            {ndarray}   : Time lags
+    msd             {ndarray}   : Mean squared displacement at the time lags
+    fit             {tuple}     : Time range of the linear regime. Default: None
+                                  (10% to 50% of the longest lag)
+    group_msd       {tuple}     : MSDs of groups of particles and the group sizes,
+                                  see MultiOriginMSD. Default: None
+    dimensions      {int}       : Number of dimensions. Default: 3
+    
+    Returns:
+    --------
+    D               {float}     : Diffusion coefficient, length^2/time
+    error           {float}     : Standard error of D
+    '''
+    time = np.asarray(time)
+    if fit is None:
+        fit = (0.1 * time[-1], 0.5 * time[-1])
+    mask = (time >= fit[0]) & (time <= fit[1])
+    if mask.sum() < 2:
+        raise ValueError("Less than two points in the fit range {}.".format(fit))
+    if mask.sum() > 3:
+        (slope, intercept), cov = np.polyfit(time[mask], msd[mask], 1, cov=True)
+        error = np.sqrt(cov[0, 0]) / (2 * dimensions)
+    else:
+        slope, intercept = np.polyfit(time[mask], msd[mask], 1)
+        error = np.nan
+    D = slope / (2 * dimensions)
+    if group_msd is not None and len(group_msd[0]) > 1:
+        group_msd, counts = group_msd
+        slopes = np.polyfit(time[mask], group_msd[:, mask].T, 1)[0]
+        mean = np.average(slopes, weights=counts)
+        spread = np.average((slopes - mean)**2, weights=counts)
+        error = np.sqrt(spread / (len(slopes) - 1)) / (2 * dimensions)
+    return D, error
+
+
+def _positions(atoms, box, unwrap=False):
+    '''
+    Positions of one or several stacked frames, from the x, y, z, the 
+    scaled xs, ys, zs or the unwrapped xu, yu, zu columns.
+    
+    Arguments:
+    ----------
+    atoms           {ndarray}   : Frame(s) as returned by Dump
+    box             {ndarray}   : Box bounds of the frame(s)
+    unwrap          {bool}      : Unwrap positions using xu, yu, zu or image flags
+                                  when available. Then (positions, unwrapped) is 
+                                  returned. Default: False
+    '''
+    names = set(atoms.dtype.names)
+    lo = box[..., 0][..., None, :]
+    length = (box[..., 1] - box[..., 0])[..., None, :]
+    unwrapped = False
+    if unwrap and {"xu", "yu", "zu"} <= names:
+        pos = structured_to_unstructured(atoms[["xu", "yu", "zu"]])
+        unwrapped = True
+    elif {"x", "y", "z"} <= names:
+        pos = structured_to_unstructured(atoms[["x", "y", "z"]])
+    elif {"xs", "ys", "zs"} <= names:
+        pos = lo + structured_to_unstructured(atoms[["xs", "ys", "zs"]]) * length
+    elif {"xu", "yu", "zu"} <= names:
+        pos = structured_to_unstructured(atoms[["xu", "yu", "zu"]])
+    else:
+        raise KeyError("No position columns found.")
+    if unwrap and not unwrapped and {"ix", "iy", "iz"} <= names:
+        pos = pos + structured_to_unstructured(atoms[["ix", "iy", "iz"]]) * length
+        unwrapped = True
+    if unwrap:
+        return pos, unwrapped
+    return pos
+
+
+def _quantity(atoms, quantity):
+    ''' A column of the frame(s), or the "speed" or "radius" of the particles. '''
+    if quantity == "speed":
+        return np.linalg.norm(structured_to_unstructured(atoms[["vx", "vy", "vz"]]), axis=-1)
+    if quantity == "radius":
+        return np.linalg.norm(structured_to_unstructured(atoms[["x", "y", "z"]]), axis=-1)
+    if quantity not in atoms.dtype.names:
+        raise KeyError("No column named {} found.".format(quantity))
+    return atoms[quantity]
+
+
+def _quantity_range(dump, quantity, steps=None, memory=None):
+    ''' Range of a quantity over all frames of interest, in one chunked pass. '''
+    low, high = np.inf, -np.inf
+    for chunk, boxes, frames in dump.iter_chunks(steps, memory):
+        values = _quantity(frames, quantity)
+        low, high = min(low, float(values.min())), max(high, float(values.max()))
+    return low, high
+
+
+def _readline(f):
+    ''' Read a complete line, raising EOFError if the file ends first. '''
+    line = f.readline()
+    if not line.endswith(b"\n"):
+        raise EOFError("Incomplete frame at the end of {}".format(getattr(f, "name", "dump file")))
+    return line
+
+
+def _read_frame_header(f):
+    '''
+    Read the header of the next frame of a text dump file, opened in
+    binary mode. Returns None when the end of the file is reached, and
+    raises EOFError if the file ends in the middle of the header.
+    
+    Arguments:
+    ----------
+    f               {file}      : File object positioned at the start of a frame
+    '''
+    header = {"time": None}
+    first = True
+    while True:
+        line = f.readline()
+        if not line and first:
+            return None
+        if not line.endswith(b"\n"):
+            raise EOFError("Incomplete frame at the end of {}".format(getattr(f, "name", "dump file")))
+        if not line.startswith(b"ITEM:"):
+            raise ValueError("Expected an ITEM line in {}, got {!r}".format(
+                getattr(f, "name", "dump file"), line[:40]))
+        first = False
+        item = line[5:].strip()
+        if item == b"TIMESTEP":
+            header["timestep"] = int(_readline(f))
+        elif item == b"TIME":
+            header["time"] = float(_readline(f))
+        elif item == b"NUMBER OF ATOMS":
+            header["natoms"] = int(_readline(f))
+        elif item.startswith(b"BOX BOUNDS"):
+            header["box"] = np.loadtxt([_readline(f) for _ in range(3)], ndmin=2)
+        elif item.startswith(b"ATOMS"):
+            header["columns"] = item.decode().split()[1:]
+            return header
+        else:
+            _readline(f)
+
+
+def _scan_frames(filename, start=0):
+    '''
+    Scan a text dump file once, recording the byte offset, timestep and 
+    number of particles of every frame without parsing the particle lines.
+    Frames may contain different numbers of particles. The scan stops 
+    before a partially written last frame, and the end of the last 
+    complete frame is returned as "end".
+    
+    Arguments:
+    ----------
+    filename        {str}       : Dump file to scan
+    start           {int}       : Byte offset to start scanning from. Default: 0
+    '''
+    offsets, timesteps, natoms = [], [], []
+    end = start
+    with _open_dump(filename) as f:
+        f.seek(start)
+        while True:
+            try:
+                header = _read_frame_header(f)
+                if header is None:
+                    break
+                line = b"\n"
+                for _ in range(header["natoms"]):
+                    line = f.readline()
+                if not line.endswith(b"\n"):
+                    break
+            except EOFError:
+                break
+            offsets.append(end)
+            timesteps.append(header["timestep"])
+            natoms.append(header["natoms"])
+            end = f.tell()
+    return {"offsets": np.asarray(offsets, dtype=np.int64),
+            "timesteps": np.asarray(timesteps, dtype=np.int64),
+            "natoms": np.asarray(natoms, dtype=np.int64),
+            "end": end}
+
+
+def _parse_frame_range(filename, store_file, offsets, starts, columns=None, 
+                       precision=np.float64, blocks=None, sort=False):
+    '''
+    Parse a range of frames of a dump file into a memory-mapped .npy 
+    array. Used both serially and as process pool worker.
+    
+    Arguments:
+    ----------
+    filename        {str}       : Dump file to parse
+    store_file      {str}       : .npy file to write the particle data to
+    offsets         {ndarray}   : Byte offsets of the frames
+    starts          {ndarray}   : First row of every frame in the flattened store,
+                                  with one extra entry marking the end of the range
+    columns         {list(str)} : Columns to parse. Default: None (all)
+    precision       {dtype}     : Type of real-valued columns. Default: np.float64
+    blocks          {tuple}     : Block offsets for block-compressed dumps. Default: None
+    sort            {bool}      : Store frames in canonical order. Default: False
+    '''
+    store = np.load(store_file, mmap_mode="r+")
+    rows = store.reshape(-1)
+    boxes, times = [], []
+    order = {}
+    frames = _read_frames_at(filename, offsets, blocks, columns, precision)
+    for i, (header, atoms) in enumerate(frames):
+        rows[starts[i]:starts[i+1]] = _canonical_order(atoms, order) if sort else atoms
+        boxes.append(header["box"].tolist())
+        times.append(header["time"])
+    store.flush()
+    return boxes, times
+
+
+def _read_frames_at(filename, offsets, blocks=None, columns=None, precision=np.float64):
+    '''
+    Generator parsing the frames at the given byte offsets of a text or 
+    binary dump file, yielding the header and the selected columns of 
+    each frame.
+    
+    Arguments:
+    ----------
+    filename        {str}       : Dump file
+    offsets         {ndarray}   : Byte offsets of the frames
+    blocks          {tuple}     : Block offsets for block-compressed dumps. Default: None
+    columns         {list(str)} : Columns to parse. Default: None (all)
+    precision       {dtype}     : Type of real-valued columns. Default: np.float64
+    '''
+    if _is_binary(filename):
+        buf = np.memmap(filename, dtype=np.uint8, mode="r")
+        for offset in offsets:
+            header, raw, end = _read_binary_frame(buf, offset)
+            layout = _atom_layout(header["columns"], columns, precision)
+            yield header, _binary_atoms(raw, layout)
+        return
+    for f in _seek_frames(filename, offsets, blocks):
+        header = _read_frame_header(f)
+        layout = _atom_layout(header["columns"], columns, precision)
+        yield header, _parse_atoms(f, header["natoms"], layout)
+
+
+def _scan_dump(filename, start=0):
+    ''' Scan a text or binary dump file, see _scan_frames. '''
+    if _is_binary(filename):
+        return _scan_binary(filename, start)
+    return _scan_frames(filename, start)
+
+
+def _first_header(filename):
+    ''' Header of the first frame of a text or binary dump file. '''
+    if _is_binary(filename):
+        return _read_binary_frame(np.memmap(filename, dtype=np.uint8, mode="r"), 0)[0]
+    with _open_dump(filename) as f:
+        return _read_frame_header(f)
+
+
+def _is_binary(filename):
+    ''' LAMMPS writes binary dumps when the file name ends with .bin. '''
+    return filename.endswith(".bin")
+
+
+# Column names of binary atom-style dumps from LAMMPS versions that do 
+# not store them, by number of columns (with and without image flags)
+BINARY_ATOM_COLUMNS = {5: ["id", "type", "xs", "ys", "zs"],
+                       8: ["id", "type", "xs", "ys", "zs", "ix", "iy", "iz"]}
+
+
+def _read_binary_frame(buf, offset):
+    '''
+    Read one frame of a LAMMPS binary dump (dump atom or dump custom with 
+    a file name ending in .bin). Both the old layout and the newer one, 
+    starting with a magic string and storing units, time and column 
+    names, are supported. The particle data are returned as a float64 
+    array over the memory map, copied only if LAMMPS wrote several chunks.
+    Raises EOFError if the frame is incomplete.
+    
+    Arguments:
+    ----------
+    buf             {ndarray}   : Memory map (uint8) of the dump file
+    offset          {int}       : Byte offset of the frame
+    
+    Returns:
+    --------
+    header          {dict}      : Timestep, time, number of particles, box and columns
+    raw             {ndarray}   : Particle data, one row per particle
+    end             {int}       : Byte offset of the next frame
+    '''
+    size = len(buf)
+    
+    def unpack(fmt):
+        nonlocal offset
+        width = struct.calcsize(fmt)
+        if offset + width > size:
+            raise EOFError("Incomplete frame at the end of binary dump")
+        values = struct.unpack_from(fmt, buf, offset)
+        offset += width
+        return values
+    
+    header = {"time": None, "columns": None}
+    timestep, = unpack("<q")
+    revision = 0
+    if timestep < 0:
+        magic_length = -timestep
+        magic, endian, revision = unpack("<{}sii".format(magic_length))
+        timestep, = unpack("<q")
+    natoms, triclinic = unpack("<qi")
+    unpack("<6i")                                   # Boundary flags
+    box = np.array(unpack("<6d")).reshape(3, 2)
+    if triclinic:
+        box = np.column_stack((box, unpack("<3d")))
+    size_one, = unpack("<i")
+    if revision > 1:
+        length, = unpack("<i")
+        if length > 0:
+            unpack("<{}s".format(length))           # Unit style
+        time_flag, = unpack("<b")
+        if time_flag:
+            header["time"], = unpack("<d")
+        length, = unpack("<i")
+        header["columns"] = unpack("<{}s".format(length))[0].decode().split()
+    if header["columns"] is None:
+        header["columns"] = BINARY_ATOM_COLUMNS.get(
+            size_one, ["c{}".format(i + 1) for i in range(size_one)])
+    nchunk, = unpack("<i")
+    chunks = []
+    for _ in range(nchunk):
+        n, = unpack("<i")
+        if offset + 8 * n > size:
+            raise EOFError("Incomplete frame at the end of binary dump")
+        chunks.append(np.frombuffer(buf, dtype="<f8", count=n, offset=offset))
+        offset += 8 * n
+    raw = chunks[0] if nchunk == 1 else np.concatenate(chunks)
+    header.update(timestep=timestep, natoms=natoms, box=box)
+    return header, raw.reshape(natoms, size_one), offset
+
+
+def _scan_binary(filename, start=0):
+    '''
+    Scan a binary dump file, recording the byte offset, timestep and 
+    number of particles of every frame. As for text dumps, a partially
+    written last frame is skipped.
+    
+    Arguments:
+    ----------
+    filename        {str}       : Dump file to scan
+    start           {int}       : Byte offset to start scanning from. Default: 0
+    '''
+    offsets, timesteps, natoms = [], [], []
+    end = start
+    if os.path.getsize(filename) > start:
+        buf = np.memmap(filename, dtype=np.uint8, mode="r")
+        while end < len(buf):
+            try:
+                header, raw, next_offset = _read_binary_frame(buf, end)
+            except EOFError:
+                break
+            offsets.append(end)
+            timesteps.append(header["timestep"])
+            natoms.append(header["natoms"])
+            end = next_offset
+    return {"offsets": np.asarray(offsets, dtype=np.int64),
+            "timesteps": np.asarray(timesteps, dtype=np.int64),
+            "natoms": np.asarray(natoms, dtype=np.int64),
+            "end": end}
+
+
+def _binary_atoms(raw, layout):
+    ''' Copy the selected columns of binary particle data into a structured array. '''
+    dtype, usecols = layout
+    atoms = np.empty(len(raw), dtype=dtype)
+    for name, col in zip(dtype.names, usecols):
+        atoms[name] = raw[:, col]
+    return atoms
+
+
+# Stream decompression of dump files, chosen by file extension
+OPENERS = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}
+
+
+def _is_compressed(filename):
+    ''' Whether the dump file is compressed, judging by its extension. '''
+    return os.path.splitext(filename)[1] in OPENERS
+
+
+def _open_dump(filename):
+    '''
+    Open a dump file for binary reading, decompressing .gz, .bz2 and .xz
+    files on the fly. Byte offsets then refer to the decompressed stream.
+    
+    Arguments:
+    ----------
+    filename        {str}       : Dump file to open
+    '''
+    opener = OPENERS.get(os.path.splitext(filename)[1], open)
+    return opener(filename, 'rb')
+
+
+def _read_gzip_member(f):
+    ''' Decompress the gzip member starting at the current position of f. '''
+    decompressor = zlib.decompressobj(wbits=31)
+    chunks = []
+    while not decompressor.eof:
+        chunk = f.read(1 << 16)
+        if not chunk:
+            break
+        chunks.append(decompressor.decompress(chunk))
+    return b"".join(chunks)
+
+
+def _seek_frames(filename, offsets, blocks=None):
+    '''
+    Generator yielding a file object positioned at each of the given 
+    frame offsets in turn. For block-compressed dumps, only the block 
+    holding the frame is decompressed, and consecutive frames from the 
+    same block reuse it.
+    
+    Arguments:
+    ----------
+    filename        {str}       : Dump file
+    offsets         {ndarray}   : Byte offsets of the frames (decompressed)
+    blocks          {tuple}     : Compressed block offsets and the decompressed
+                                  offsets they start at. Default: None
+    '''
+    if blocks is None:
+        with _open_dump(filename) as f:
+            for offset in offsets:
+                if f.tell() != offset:
+                    f.seek(offset)
+                yield f
+        return
+    with open(filename, 'rb') as raw:
+        current = None
+        for offset, block, block_start in zip(offsets, *blocks):
+            if block != current:
+                raw.seek(block)
+                f = io.BytesIO(_read_gzip_member(raw))
+                current = block
+            f.seek(offset - block_start)
+            yield f
+
+
+def _species_slices(types):
+    ''' Slices of the contiguous blocks of each type in a sorted type array. '''
+    species, first = np.unique(types, return_index=True)
+    last = np.append(first[1:], len(types))
+    return {int(t): slice(int(a), int(b)) for t, a, b in zip(species, first, last)}
+
+
+def _canonical_order(atoms, cache):
+    '''
+    Reorder a frame by atom id, grouped by type. The slot of every id in 
+    the canonical layout is cached, such that later frames with the same 
+    particles are put in place by a single vectorised scatter, and frames
+    in the same order as the previous one reuse its permutation. A new 
+    layout is only built (by sorting) when the set of particles changes.
+    
+    Arguments:
+    ----------
+    atoms           {ndarray}   : Frame with id and type columns
+    cache           {dict}      : Layout state, shared between frames
+    '''
+    ids = atoms["id"]
+    if "ids" in cache and np.array_equal(ids, cache["ids"]):
+        return atoms[cache["perm"]]
+    slots = cache.get("slots")
+    if slots is not None and len(ids) == cache["natoms"] and ids.max() < len(slots):
+        target = slots[ids]
+        if target.min() >= 0:
+            perm = np.empty_like(target)
+            perm[target] = np.arange(len(ids), dtype=target.dtype)
+            cache["ids"], cache["perm"] = ids.copy(), perm
+            return atoms[perm]
+    perm = np.lexsort((ids, atoms["type"]))
+    slots = np.full(ids.max() + 1, -1, dtype=np.int64)
+    slots[ids[perm]] = np.arange(len(ids))
+    cache.update(ids=ids.copy(), perm=perm, slots=slots, natoms=len(ids),
+                 species=_species_slices(atoms["type"][perm]))
+    return atoms[perm]
+
+
+# Per-atom quantities LAMMPS writes as integers
+INTEGER_COLUMNS = ("id", "type", "mol", "proc", "procp1", "ix", "iy", "iz")
+
+
+def _atom_layout(header_columns, columns=None, precision=np.float64):
+    '''
+    Structured dtype and column indices for the selected columns of an 
+    ITEM: ATOMS header. Integer quantities are stored as int32, the rest
+    with the given floating point precision.
+    
+    Arguments:
+    ----------
+    header_columns  {list(str)} : Column names found in the dump header
+    columns         {list(str)} : Columns to load. Default: None (all)
+    precision       {dtype}     : Type of real-valued columns. Default: np.float64
+    '''
+    columns = header_columns if columns is None else columns
+    usecols = []
+    for name in columns:
+        if name not in header_columns:
+            raise KeyError("No column named {} found.".format(name))
+        usecols.append(header_columns.index(name))
+    dtype = np.dtype([(name, np.int32 if name in INTEGER_COLUMNS else precision)
+                      for name in columns])
+    return dtype, usecols
+
+
+def _parse_atoms(f, natoms, layout):
+    '''
+    Parse the particle lines of a frame in bulk, reading only the
+    selected columns.
+    
+    Arguments:
+    ----------
+    f               {file}      : File object positioned at the first particle line
+    natoms          {int}       : Number of particles in the frame
+    layout          {tuple}     : Structured dtype and column indices, see _atom_layout
+    '''
+    dtype, usecols = layout
+    lines = [f.readline() for _ in range(natoms)]
+    if lines and not lines[-1].endswith(b"\n"):
+        raise EOFError("Incomplete frame at the end of {}".format(getattr(f, "name", "dump file")))
+    return np.loadtxt(lines, dtype=dtype, usecols=usecols, ndmin=1)
 
-    def plot_position_distribution(self, steps=[0], show=False, save=False):
-        '''
-        Plots a histogram of the radius of the particles. 
         
+class Segment:
+    '''
+    A single run or minimization in a log file, with its own thermo 
+    columns and the commands that set it up: the active fixes, the 
+    timestep and the data files written when it finished.
+    '''
+    def __init__(self, variables, commands, fixes, timestep, run=None, minimize=False):
+        '''
         Arguments:
         ----------
-        steps           {list}      : The timesteps of interest
-        show            {bool}      : Show plot yes/no (True/False). Default: False
-        save            {bool}      : Save plot yes/no (True/False). Default: False
+        variables       {list(str)} : Names of the thermo columns
+        commands        {list(str)} : Input commands since the previous segment
+        fixes           {dict}      : Active fixes, fix ID -> (group, style, arguments)
+        timestep        {float}     : Timestep in time units
+        run             {int}       : Number of steps of the run command. Default: None
+        minimize        {bool}      : Whether the segment is a minimization. Default: False
         '''
-        for i in steps:
-            positions = self.data[i][:, 2:5]
-            radius = np.linalg.norm(positions, axis=1)
-            plt.hist(radius, 100, density=True, facecolor='b', alpha=0.75)
-            plt.xlabel('Radius')
-            plt.ylabel('Density')
-            plt.grid()
-            if show: plt.show()
-            if save: plt.savefig('../fig/position_distribution_{}.png'.format(t))
+        self.variables = variables
+        self.index = {variable: i for i, variable in enumerate(variables)}
+        self.commands = commands
+        self.fixes = fixes
+        self.timestep = timestep
+        self.run = run
+        self.minimize = minimize
+        self.write_data = []        # Data files written after the segment
+        self.performance = {}       # Timings reported when the segment finished
+        self.running = RunningStatistics()
+        self._chunks = []
+
+    @property
+    def array(self):
+        ''' Thermo data, one row per variable. '''
+        if not self._chunks:
+            return np.empty((len(self.variables), 0))
+        if len(self._chunks) > 1:
+            self._chunks = [np.hstack(self._chunks)]
+        return self._chunks[0]
 
+    @property
+    def rows(self):
+        ''' Number of thermo rows, without joining the appended chunks. '''
+        return sum(chunk.shape[1] for chunk in self._chunks)
 
-    def plot_velocity_distribution(self, steps=[0], show=False, save=False):
+    def append(self, array):
+        ''' Add rows of thermo data, one row per variable. '''
+        if array.shape[1]:
+            self._chunks.append(array)
+            self.running.update(array)
+
+    def latest(self, key):
         '''
-        Plots a histogram of the speed of all particles at selected timesteps.
+        Returns the last value of the thermo column named key, or None if
+        the segment has no rows yet.
         
         Arguments:
         ----------
-        steps           {list(int)} : The timesteps of interest
-        show            {bool}      : Show plot yes/no (True/False). Default: False
-        save            {bool}      : Save plot yes/no (True/False). Default: False
+        key         {str}   : String containing keyword.
         '''
-        for i in steps:
-            velocity = self.data[i][:, 5:8]
-            speed = np.linalg.norm(velocity, axis=1)
-            plt.hist(speed, 100, density=True, facecolor='b', alpha=0.75)
-            plt.xlabel('Speed')
-            plt.ylabel('Density')
-            plt.grid()
-            if show: plt.show()
-            if save: plt.savefig('../fig/velocity_distribution_{}.png'.format(t))
-            
-    def plot_diffusion(self, show=False, save=False):
+        if key not in self.index:
+            raise KeyError("No category named {} found.".format(key))
+        if not self._chunks:
+            return None
+        return float(self._chunks[-1][self.index[key], -1])
+
+    def find(self, key):
         '''
-        Plot the diffusion and estimate the diffusion constant.
+        Returns a view of the thermo column named key.
+        
+        Arguments:
+        ----------
+        key         {str}   : String containing keyword.
         '''
-        pos = self.data[:,:,2:5]
-        initial_pos = pos[0]
-        diff = pos - initial_pos[np.newaxis]
-        res = np.einsum('ijk,ijk->i',diff,diff)
-        plt.plot(res)
-        if save: plt.savefig("../fig/diffusion.png")
-        if show: plt.show()
+        if key not in self.index:
+            raise KeyError("No category named {} found.".format(key))
+        return self.array[self.index[key]]
+
+    @property
+    def styles(self):
+        ''' Styles of the active fixes. '''
+        return [style for group, style, args in self.fixes.values()]
+
+    @property
+    def temperature(self):
+        '''
+        Start and stop temperature of the active thermostat, or None if 
+        no thermostat is active.
+        '''
+        for group, style, args in self.fixes.values():
+            if "temp" in args:
+                i = args.index("temp")
+                return float(args[i+1]), float(args[i+2])
+            if style in ("langevin", "temp/berendsen", "temp/csvr", "temp/csld"):
+                return float(args[0]), float(args[1])
+        return None
+
+    @property
+    def pressure(self):
+        '''
+        Start and stop pressure of the active barostat, or None if no 
+        barostat is active.
+        '''
+        for group, style, args in self.fixes.values():
+            for keyword in ("iso", "aniso"):
+                if keyword in args:
+                    i = args.index(keyword)
+                    return float(args[i+1]), float(args[i+2])
+        return None
+
+    def equilibration(self, keys=("Density", "Enthalpy", "Temp"), candidates=50):
+        '''
+        Detect where the thermo series have equilibrated, as the start 
+        that maximizes the effective number of uncorrelated samples (see
+        detect_equilibration). Only meaningful for stages at a constant
+        temperature and pressure, not for ramps.
         
-        t = np.linspace(0, 500, len(res))
-        D = np.divide(res, t) / 6
-        print(D)
+        Arguments:
+        ----------
+        keys            {list(str)} : Thermo columns to consider, the ones missing 
+                                      are skipped. Default: Density, Enthalpy, Temp
+        candidates      {int}       : Number of start points tried. Default: 50
         
-    def plot_radial(self, show=False, save=False, L=3):
+        Returns:
+        --------
+        start           {int}       : First equilibrated row, the latest over the keys
+        details         {dict}      : Key -> (start, statistical inefficiency, 
+                                      effective number of samples)
         '''
-        Plot the radial distribution function as a function of relative distance.
+        details = {}
+        for key in keys:
+            if key in self.index and self.array.shape[1] > 2:
+                details[key] = detect_equilibration(self.find(key), candidates)
+        start = max([detail[0] for detail in details.values()], default=0)
+        return start, details
+
+    def statistics(self, equilibrated=False):
         '''
-        pos = self.data[:,:,2:5]
-        from scipy.spatial import distance_matrix
-        d = distance_matrix(pos, pos)
-        print(d)
-        d_ = d.flatten()
-        bins = np.linspace(0, L/2, 1000)
-        inds = np.digitize(d.flatten(), bins)
-        plt.plot(inds)
-        if show: plt.show()
-       
+        Mean and standard error of every thermo column, all columns at 
+        once. The error is estimated both by block averaging (see 
+        RunningStatistics) and from the integrated autocorrelation time 
+        (see statistical_inefficiency). For a segment that is still being
+        read, Segment.running gives the block averages without going 
+        through the rows again.
+        
+        Arguments:
+        ----------
+        equilibrated    {bool}      : Leave out the rows before equilibration, see
+                                      Segment.equilibration. Default: False
         
+        Returns:
+        --------
+        statistics      {dict}      : Key -> dict with "mean", "error" (block 
+                                      averaging), "tau" (integrated autocorrelation 
+                                      time in rows) and "tau_error"
+        '''
+        array = self.array
+        if equilibrated:
+            array = array[:, self.equilibration()[0]:]
+        if array.shape[1] < 2:
+            raise ValueError("At least two rows are needed.")
+        blocks = RunningStatistics()
+        blocks.update(array)
+        mean, error, level = blocks.result()
+        g = statistical_inefficiency(array)
+        tau_error = np.sqrt(array.var(axis=1) * g / array.shape[1])
+        return {key: {"mean": mean[i], "error": error[i], "tau": g[i] / 2, 
+                      "tau_error": tau_error[i]} 
+                for i, key in enumerate(self.variables)}
+
+    def target_temperature(self):
+        '''
+        Temperature set by the thermostat at every thermo row, ramped 
+        linearly from the start to the stop temperature over the run like 
+        LAMMPS does. Falls back to the Temp column if the ramp is unknown.
+        '''
+        temperature = self.temperature
+        if temperature is None or not self.run or "Step" not in self.index:
+            return self.find("Temp")
+        step = self.find("Step")
+        start, stop = temperature
+        return start + (stop - start) * (step - step[0]) / self.run
+
+    def matches(self, style=None, temp=None, write_data=None, minimize=None):
+        ''' Whether the segment fulfills all the given criteria, see Log.select. '''
+        if style is not None and style not in self.styles:
+            return False
+        if temp is not None:
+            temperature = self.temperature
+            if temperature is None or not np.allclose(temperature, temp):
+                return False
+        if write_data is not None:
+            if not any(write_data in filename for filename in self.write_data):
+                return False
+        if minimize is not None and minimize != self.minimize:
+            return False
+        return True
+
+    def __repr__(self):
+        kind = "minimize" if self.minimize else "run {}".format(self.run)
+        return "Segment({}, fixes={}, temp={}, rows={})".format(
+            kind, self.styles, self.temperature, self.array.shape[1])
+
+
+# Input commands that are recorded for the segments of a log file
+LOG_COMMANDS = ("fix", "unfix", "run", "minimize", "timestep", "write_data", 
+                "write_restart", "velocity", "thermo", "thermo_style", "thermo_modify",
+                "reset_timestep", "dump", "undump", "compute", "uncompute", "variable",
+                "group", "mass", "read_data", "read_restart", "pair_style", "pair_coeff",
+                "neighbor", "neigh_modify", "displace_atoms", "change_box")
+
+
 class Log:
     ''' Analyzing log files, containing system information. '''
-    def __init__(self, filename, ignore_first=0):
-        '''Initialize class by reading log file.
+    def __init__(self, filename, ignore_first=0, cache=None, cache_dir=None, cache_size=2**30):
+        '''Initialize class by reading log file. With a cache, the parsed log
+        is stored as an .npz file, either next to the log file or in a 
+        central cache directory, and is reused as long as the size and 
+        modification time of the log file are unchanged.
         
         Arguments:
         ----------
         filename            {str}   : String with file to load.
+        ignore_first        {int}   : Ignore equilibriation fixes. Prefer selecting
+                                      segments with Log.select or Log.segment.
+        cache               {bool}  : Store the parsed log next to the log file. Default: None
+        cache_dir           {str}   : Directory to store parsed logs in, implies cache. 
+                                      Default: None
+        cache_size          {int}   : Size limit of the cache directory in bytes, least 
+                                      recently used logs are evicted. Default: 1 GiB
+        '''
+        cache_file = None
+        if cache or cache_dir is not None:
+            cache_file = _log_cache_file(filename, cache_dir)
+        if cache_file is None or not self.load_cache(cache_file, filename, ignore_first):
+            self.read_log_file(filename, ignore_first)
+            if cache_file is not None:
+                self.save_cache(cache_file)
+                if cache_dir is not None:
+                    _evict_log_cache(cache_dir, cache_size, keep=cache_file)
+
+    def save_cache(self, cache_file):
+        '''
+        Store the parsed log, including the parser state, as an .npz file.
+        The size and modification time of the log file when it was last 
+        read are stored along, to tell when the cache is outdated.
+        
+        Arguments:
+        ----------
+        cache_file          {str}   : Filename of the cache.
+        '''
+        size, mtime = self._source
+        meta = {"path": os.path.abspath(self.filename), "size": size, 
+                "mtime": mtime, "offset": self._offset, "open": self._open,
+                "complete": self._complete,
+                "timestep": self.timestep, "mass": self.mass, "fixes": self._fixes, 
+                "commands": self._commands, "run": self._run, "minimize": self._minimize,
+                "memory": self._memory, "stat": self._stat,
+                "segments": [{"variables": segment.variables, "commands": segment.commands,
+                              "fixes": segment.fixes, "timestep": segment.timestep,
+                              "run": segment.run, "minimize": segment.minimize, 
+                              "write_data": segment.write_data, 
+                              "performance": segment.performance} 
+                             for segment in self.segments]}
+        arrays = {"segment{}".format(i): segment.array for i, segment in enumerate(self.segments)}
+        tmp_file = cache_file + ".tmp"
+        with open(tmp_file, "wb") as f:
+            np.savez(f, meta=np.array(json.dumps(meta)), **arrays)
+        os.replace(tmp_file, cache_file)
+
+    def load_cache(self, cache_file, filename, ignore_first=0):
+        '''
+        Load a parsed log stored by Log.save_cache. Returns False if there
+        is no cache, or if it belongs to another file or an older version 
+        of the log file.
+        
+        Arguments:
+        ----------
+        cache_file          {str}   : Filename of the cache.
+        filename            {str}   : Log file the cache should belong to.
         ignore_first        {int}   : Ignore equilibriation fixes.
         '''
-        self.read_log_file(filename, ignore_first)
+        if not os.path.exists(cache_file):
+            return False
+        stat = os.stat(filename)
+        try:
+            with np.load(cache_file) as npz:
+                meta = json.loads(str(npz["meta"]))
+                if (meta["path"] != os.path.abspath(filename) or meta["size"] != stat.st_size
+                    or meta["mtime"] != stat.st_mtime_ns or "complete" not in meta):
+                    return False
+                arrays = [npz["segment{}".format(i)] for i in range(len(meta["segments"]))]
+        except (OSError, ValueError, KeyError):
+            return False            # Corrupt or written by another version
+        
+        def fixes(fixes):
+            return {ID: tuple(fix) for ID, fix in fixes.items()}
+        
+        self.filename = filename
+        self.ignore_first = ignore_first
+        self.timestep = meta["timestep"]
+        self.mass = meta["mass"]
+        self.segments = []
+        for entry, array in zip(meta["segments"], arrays):
+            segment = Segment(entry["variables"], entry["commands"], fixes(entry["fixes"]),
+                              entry["timestep"], entry["run"], entry["minimize"])
+            segment.write_data = entry["write_data"]
+            segment.performance = entry["performance"]
+            segment.append(array)
+            self.segments.append(segment)
+        self._fixes = fixes(meta["fixes"])
+        self._commands = meta["commands"]
+        self._run = meta["run"]
+        self._minimize = meta["minimize"]
+        self._memory = meta["memory"]
+        self._stat = meta["stat"]
+        self._open = meta["open"]
+        self._complete = meta["complete"]
+        self._offset = meta["offset"]
+        self._source = (meta["size"], meta["mtime"])
+        os.utime(cache_file)        # Mark as recently used
+        self._joined = None
+        if self._offset < stat.st_size:
+            self.update()           # Lines not parsed when the cache was saved
+        return True
 
     def read_log_file(self, filename, ignore_first):
-        ''' Reading log file by going through file line after line. 
+        ''' Reading log file, locating the thermo blocks in one scan over 
+        the lines and converting each block in bulk. Every run or 
+        minimization is kept as a separate Segment.
         
         Arguments:
         ----------
         filename            {str}   : String with file to load.
         ignore_first        {int}   : Ignore equilibriation fixes.
         '''
-        f = open(filename, "r")
-
+        self.filename = filename
+        self.ignore_first = ignore_first
         self.timestep = 0.005        # Default
         self.mass = 1                # Default
-        self.lst = []
+        self.segments = []
+        self._fixes = {}
+        self._commands = []
+        self._run = None
+        self._minimize = False
+        self._memory = None         # Memory usage reported before the next segment
+        self._stat = None           # Last per-processor statistic, for its histogram
+        self._open = False          # Whether the last segment is still being read
+        self._complete = False      # Whether LAMMPS reported the total wall time
+        self._offset = 0            # Bytes of the file parsed so far
+        self._source = None         # Size and modification time of the file when read
+        self._joined = None         # Variables, index and array of the joined segments
+        self.update()
+
+    def update(self):
+        '''
+        Parse the lines appended to the log file since it was last read, 
+        for following simulations that are still running. Parsing resumes
+        from the stored byte offset and parser state, and a partially 
+        written last line is left for the next update. If the file has
+        shrunk (a new simulation overwrote it), it is parsed from scratch.
+        
+        Returns:
+        --------
+        rows            {int}       : Number of new thermo rows
+        '''
+        if os.path.getsize(self.filename) < self._offset:
+            self.read_log_file(self.filename, self.ignore_first)
+            return self.rows
+        rows, segments = self.rows, len(self.segments)
+        with open(self.filename, "rb") as f:
+            # Stat before reading, such that lines appended meanwhile outdate the cache
+            stat = os.fstat(f.fileno())
+            f.seek(self._offset)
+            data = f.read()
+        self._source = (stat.st_size, stat.st_mtime_ns)
+        end = data.rfind(b"\n") + 1
+        self._offset += end
+        self._consume(data[:end].decode(errors="replace").splitlines(keepends=True))
+        if self.rows != rows or len(self.segments) != segments:
+            self._joined = None     # Join the segments again on the next access
+        return self.rows - rows
+
+    @property
+    def wall_time(self):
+        ''' Loop time of the finished segments in seconds. '''
+        return sum(segment.performance.get("loop_time", 0) for segment in self.segments)
+
+    @property
+    def rows(self):
+        ''' Total number of thermo rows in all segments. '''
+        return sum(segment.rows for segment in self.segments)
+
+    @property
+    def finished(self):
+        '''
+        Whether LAMMPS has finished the whole input script, i.e. the log
+        ends with the total wall time. False for runs that are still going,
+        were killed (also between two run commands), or logs that are not
+        LAMMPS logs at all.
+        '''
+        return self._complete
+
+    def progress(self):
+        '''
+        Latest progress of the simulation, read from the last thermo row.
+        Relies on the S/CPU and CPULeft thermo keywords (spcpu and 
+        cpuremain), which are None if not in the thermo output.
+        
+        Returns:
+        --------
+        progress        {dict}      : Step, fraction of the current run done,
+                                      steps per CPU second (S/CPU) and estimated
+                                      CPU seconds left of the current run (CPULeft)
+        '''
+        progress = {"step": None, "fraction": None, "S/CPU": None, "CPULeft": None}
+        if not self.segments:
+            return progress
+        segment = self.segments[-1]
+        for key in ("S/CPU", "CPULeft"):
+            if key in segment.index:
+                progress[key] = segment.latest(key)
+        if "Step" in segment.index and segment.latest("Step") is not None:
+            progress["step"] = int(segment.latest("Step"))
+            if segment.run:
+                first = segment.array[segment.index["Step"], 0]
+                progress["fraction"] = float(progress["step"] - first) / segment.run
+        return progress
 
-        read = False                # True if the line should be read
-        for i, line in enumerate(f.readlines()):
+    def _consume(self, lines):
+        '''
+        Go through complete lines of the log file, locating the thermo 
+        blocks and keeping track of the commands that precede them.
+        
+        Arguments:
+        ----------
+        lines       {list(str)}     : Lines of the log file
+        '''
+        start = 0 if self._open else None     # First line of the current block
+        for i, line in enumerate(lines):
+            if start is not None:
+                if line.startswith("Loop time of"):
+                    segment = self.segments[-1]
+                    segment.append(_parse_thermo_block(lines[start:i], segment.variables))
+                    words = line.split()
+                    segment.performance.update(loop_time=float(words[3]), procs=int(words[5]),
+                                               steps=int(words[8]), atoms=int(words[11]))
+                    start = None
+                    self._open = False
             # Search for variables
-            if line.startswith("Step"):
-                self.variables = line.split()
-                num_variables = len(self.variables)
-                self.lst.append([[] for _ in range(num_variables)])
-                read = True
-            elif line.startswith("Loop time of"):
-                read = False
-            elif read:
-                #print(line)
-                strings = line.split()
-                for j, string in enumerate(strings):
-                    self.lst[-1][j].append(float(line.split()[j]))
-            # Search for timestep
-            elif line.startswith("timestep"):
-                self.timestep = line.split()[1]
-            # Search for mass
-            elif line.startswith("mass"):
-                self.mass = float(line.split()[1])
-        f.close()
-        self.array = np.hstack(self.lst[ignore_first:])
+            elif line.startswith("Step"):
+                self.segments.append(Segment(line.split(), self._commands, dict(self._fixes),
+                                             self.timestep, self._run, self._minimize))
+                if self._memory is not None:
+                    self.segments[-1].performance["memory"] = self._memory
+                self._commands = []
+                self._run = None
+                self._minimize = False
+                self._memory = None
+                self._open = True
+                start = i + 1
+            elif line.startswith("Total wall time:"):
+                self._complete = True
+            elif not self._summary(line):
+                self._command(line)
+        if start is not None:       # Run still going or aborted
+            segment = self.segments[-1]
+            segment.append(_parse_thermo_block(lines[start:], segment.variables))
+
+    def _summary(self, line):
+        '''
+        Parse a line of the performance summary printed after a run or 
+        minimization into the performance record of the last segment: 
+        speed, CPU use, MPI task timing breakdown, per-processor atom 
+        and neighbor statistics with histograms, and neighbor list 
+        builds. The memory usage printed before a run is held for the 
+        next segment. Returns whether the line was part of a summary.
+        
+        Arguments:
+        ----------
+        line        {str}   : Line of the log file
+        '''
+        words = line.split()
+        if not words:
+            return False
+        if line.startswith("Per MPI rank memory allocation"):
+            self._memory = [float(word) for word in line.split("=")[1].split()[:-1] if word != "|"]
+            return True
+        if not self.segments:
+            return False
+        performance = self.segments[-1].performance
+        if words[0] == "Performance:":
+            # E.g. Performance: 2.253 ns/day, 10.654 hours/ns, 104.287 timesteps/s
+            for value, unit in zip(words[1::2], words[2::2]):
+                performance[unit.rstrip(",")] = float(value)
+        elif line.endswith("OpenMP threads\n") and "% CPU use with" in line:
+            performance["cpu_use"] = float(words[0].rstrip("%"))
+            performance["mpi_tasks"] = int(words[4])
+            performance["omp_threads"] = 1 if words[8] == "no" else int(words[8])
+        elif words[0] in ("Pair", "Bond", "Kspace", "Neigh", "Comm", "Output", "Modify", "Other") and "|" in line:
+            fields = [field.strip() for field in line.split("|")]
+            values = [float(field) if field else None for field in fields[1:]]
+            performance.setdefault("timing", {})[words[0]] = dict(
+                zip(("min", "avg", "max", "varavg", "total"), values))
+        elif words[0] in ("Nlocal:", "Nghost:", "Neighs:", "FullNghs:", "HalfNghs:"):
+            # E.g. Nlocal:    1500 ave 1510 max 1489 min
+            self._stat = words[0].rstrip(":")
+            performance[self._stat] = {"ave": float(words[1]), "max": float(words[3]), 
+                                       "min": float(words[5])}
+        elif words[0] == "Histogram:" and self._stat is not None:
+            performance[self._stat]["histogram"] = [int(word) for word in words[1:]]
+            self._stat = None
+        elif line.startswith("Total # of neighbors"):
+            performance["neighbors"] = int(float(words[-1]))
+        elif line.startswith("Ave neighs/atom"):
+            performance["neighs_per_atom"] = float(words[-1])
+        elif line.startswith("Neighbor list builds"):
+            performance["neighbor_builds"] = int(words[-1])
+        elif line.startswith("Dangerous builds") and words[-1].isdigit():
+            performance["dangerous_builds"] = int(words[-1])
+        else:
+            return False
+        return True
+
+    def performance_report(self):
+        '''
+        Derived performance numbers of every finished segment, to spot 
+        badly balanced or throttled runs:
+            atom_steps_per_s    : Atoms times steps per second of loop time
+            imbalance           : Max over average time spent in Pair and Neigh 
+                                  over the processors, 1 is perfectly balanced
+            atom_imbalance      : Max over average number of local atoms
+            comm_share          : Fraction of the loop time spent in Comm
+            neigh_share         : Fraction of the loop time spent in Neigh
+            steps_per_build     : Average steps between neighbor list builds
+            cpu_use             : CPU use in percent, well below 100 when throttled
+            skin                : Suggested change of the neighbor skin, "increase", 
+                                  "decrease" or "keep"
+        
+        Returns:
+        --------
+        report          {list(dict)}    : One record per segment, empty for unfinished ones
+        '''
+        report = []
+        for segment in self.segments:
+            performance = segment.performance
+            record = {}
+            if "loop_time" in performance:
+                if performance["loop_time"] > 0:
+                    record["atom_steps_per_s"] = (performance["atoms"] * performance["steps"] 
+                                                  / performance["loop_time"])
+                timing = performance.get("timing", {})
+                compute = [timing[key] for key in ("Pair", "Neigh") if key in timing]
+                average = sum(section["avg"] for section in compute)
+                if average > 0:
+                    record["imbalance"] = sum(section["max"] for section in compute) / average
+                if performance.get("Nlocal", {}).get("ave"):
+                    record["atom_imbalance"] = performance["Nlocal"]["max"] / performance["Nlocal"]["ave"]
+                for key in ("Comm", "Neigh"):
+                    if key in timing:
+                        record[key.lower() + "_share"] = timing[key]["total"] / 100
+                if performance.get("neighbor_builds"):
+                    record["steps_per_build"] = performance["steps"] / performance["neighbor_builds"]
+                if "cpu_use" in performance:
+                    record["cpu_use"] = performance["cpu_use"]
+                record["skin"] = _skin_suggestion(performance, record)
+            report.append(record)
+        return report
+
+    def _command(self, line):
+        '''
+        Keep track of an input command echoed to the log file. Commands 
+        using variables are echoed twice, the line before substitution 
+        is skipped.
+        
+        Arguments:
+        ----------
+        line        {str}   : Line of the log file
+        '''
+        words = line.split()
+        if not words or words[0] not in LOG_COMMANDS or "$" in line:
+            return
+        command = words[0]
+        self._commands.append(line.strip())
+        # Search for timestep
+        if command == "timestep":
+            self.timestep = float(words[1])
+        # Search for mass
+        elif command == "mass":
+            self.mass = float(words[1])
+        elif command == "fix" and len(words) >= 4:
+            self._fixes[words[1]] = (words[2], words[3], words[4:])
+        elif command == "unfix":
+            self._fixes.pop(words[1], None)
+        elif command == "run":
+            self._run = int(float(words[1]))
+        elif command == "minimize":
+            self._minimize = True
+        elif command == "write_data" and self.segments:
+            self.segments[-1].write_data.append(words[1])
+
+    def combine(self, ignore_first=0):
+        '''
+        Join the segments into Log.array, as one series per variable. 
+        Only variables found in all the joined segments are kept. The 
+        segments are joined lazily when Log.array, Log.index or 
+        Log.variables is accessed, and again only after new rows were read.
+        
+        Arguments:
+        ----------
+        ignore_first        {int}   : Number of segments to leave out. Default: 0
+        '''
+        self.ignore_first = ignore_first
+        self._joined = None
+
+    def _join(self):
+        ''' Variables, index and array of the joined segments, see Log.combine. '''
+        if self._joined is None:
+            segments = self.segments[self.ignore_first:]
+            if not segments:
+                self._joined = [], {}, np.empty((0, 0))
+                return self._joined
+            variables = [variable for variable in segments[-1].variables
+                         if all(variable in segment.index for segment in segments)]
+            if all(segment.variables == variables for segment in segments):
+                array = np.hstack([segment.array for segment in segments])
+            else:
+                array = np.vstack([np.hstack([segment.find(variable) for segment in segments])
+                                   for variable in variables])
+            self._joined = variables, {variable: i for i, variable in enumerate(variables)}, array
+        return self._joined
+
+    @property
+    def variables(self):
+        ''' Thermo columns found in all the joined segments. '''
+        return self._join()[0]
+
+    @property
+    def index(self):
+        ''' Row of every variable in Log.array. '''
+        return self._join()[1]
+
+    @property
+    def array(self):
+        ''' Thermo data of the joined segments, one row per variable. '''
+        return self._join()[2]
+
+    def select(self, style=None, temp=None, write_data=None, minimize=None):
+        '''
+        Returns the segments fulfilling all the given criteria. For 
+        instance, the heating ramp of the water simulations is found by
+        log.select(style="npt", temp=(300, 450)).
+        
+        Arguments:
+        ----------
+        style               {str}   : Style of an active fix, e.g. "nvt" or "npt"
+        temp                {tuple} : Start and stop temperature of the thermostat
+        write_data          {str}   : (Part of) a data file written after the segment
+        minimize            {bool}  : Whether the segment is a minimization
+        '''
+        return [segment for segment in self.segments 
+                if segment.matches(style, temp, write_data, minimize)]
+
+    def segment(self, style=None, temp=None, write_data=None, minimize=None):
+        '''
+        Returns the single segment fulfilling the given criteria, see 
+        Log.select. Raises KeyError if there is none, ValueError if 
+        there are several.
+        '''
+        segments = self.select(style, temp, write_data, minimize)
+        if not segments:
+            raise KeyError("No segment found with the given criteria.")
+        if len(segments) > 1:
+            raise ValueError("{} segments found with the given criteria.".format(len(segments)))
+        return segments[0]
+
+    def statistics(self, equilibrated=False):
+        '''
+        Mean and standard error of every thermo column in every segment,
+        see Segment.statistics. Segments with less than two rows get None.
+        
+        Arguments:
+        ----------
+        equilibrated    {bool}      : Leave out the rows before equilibration. 
+                                      Default: False
+        '''
+        return [segment.statistics(equilibrated) if segment.array.shape[1] > 1 else None
+                for segment in self.segments]
+
+    def fluctuations(self, mass=None, equilibrated=True):
+        '''
+        Heat capacity, isothermal compressibility and thermal expansion 
+        coefficient from the last NPT segment at a constant temperature,
+        see npt_fluctuations.
+        
+        Arguments:
+        ----------
+        mass            {float}     : Total mass of the system in g/mol, needed if 
+                                      there is no Volume column. Default: None
+        equilibrated    {bool}      : Leave out the rows before equilibration. 
+                                      Default: True
+        '''
+        stages = [segment for segment in self.select(style="npt") 
+                  if segment.temperature is not None 
+                  and segment.temperature[0] == segment.temperature[1]
+                  and segment.array.shape[1] > 1]
+        if not stages:
+            raise KeyError("No NPT segment at constant temperature found.")
+        return npt_fluctuations(stages[-1], mass, equilibrated)
+
+    def green_kubo(self, quantity="viscosity", tmax=5.0, mass=None, equilibrated=True):
+        '''
+        Viscosity or thermal conductivity from the last segment at a
+        constant temperature with the needed thermo columns, see
+        green_kubo.
+
+        Arguments:
+        ----------
+        quantity        {str}       : "viscosity" or "thermal_conductivity".
+                                      Default: "viscosity"
+        tmax            {float}     : Longest correlation time in ps. Default: 5
+        mass            {float}     : Total mass of the system in g/mol, needed if
+                                      there is no Volume column. Default: None
+        equilibrated    {bool}      : Leave out the rows before equilibration.
+                                      Default: True
+        '''
+        columns = GREEN_KUBO_COLUMNS.get(quantity)
+        if columns is None:
+            raise KeyError("No quantity named {} found.".format(quantity))
+        stages = [segment for segment in self.segments
+                  if not segment.minimize and segment.array.shape[1] > 1
+                  and all(key in segment.index for key in columns)
+                  and (segment.temperature is None
+                       or segment.temperature[0] == segment.temperature[1])]
+        if not stages:
+            raise KeyError("No segment at constant temperature with {} found.".format(
+                ", ".join(columns)))
+        return green_kubo(stages[-1], quantity, tmax, mass, equilibrated)
+
+    def ramps(self):
+        '''
+        The last heating and the last cooling segment, i.e. runs with a 
+        thermostat ramping the temperature up or down. None if not found.
+        
+        Returns:
+        --------
+        heating         {Segment}   : Last segment ramping the temperature up
+        cooling         {Segment}   : Last segment ramping the temperature down
+        '''
+        heating = cooling = None
+        for segment in self.segments:
+            temperature = segment.temperature
+            if temperature is None or not segment.array.shape[1]:
+                continue
+            if temperature[1] > temperature[0]:
+                heating = segment
+            elif temperature[1] < temperature[0]:
+                cooling = segment
+        return heating, cooling
 
     def categorize(self):
         '''
@@ -190,20 +2821,16 @@ class Log:
         '''
         Search for a category (Step, Temp, Press etc...). If the 
         keyword exists, if returns the associated array containing
-        the quantity as a function of timesteps.
+        the quantity as a function of timesteps. The array is a view
+        into the log data, not a copy.
         
         Arguments:
         ----------
         key         {str}   : String containing keyword.
         '''
-        array = None
-        for i, variable in enumerate(self.variables):
-            if variable == key:
-                array = self.array[i]
-        if array is None:
+        if key not in self.index:
             raise KeyError("No category named {} found.".format(key))
-        else:
-            return np.array(array)
+        return self.array[self.index[key]]
             
     def step2time(self, steps):
         '''
@@ -263,3 +2890,806 @@ class Log:
         plt.ylabel("Pressure [m$^{-3}$]")
         if save: plt.savefig("../fig/temp_pres_{}.png".format(self.timestep))
         if show: plt.show()
+
+
+def load_sweep(root, pattern="*/log.data", observables=None, workers=None, 
+               ignore_first=0, cache_dir=None):
+    '''
+    Load all log files of a parameter sweep, where the parameters are 
+    encoded in the directory names, e.g. ZH0.5_theta100_B40_D0.15. The 
+    logs are parsed concurrently in a process pool, and the parameters 
+    and observables of every run are returned as one table of columns.
+    Observables missing for a run, for instance because it is still 
+    running or crashed, are NaN.
+    
+    Arguments:
+    ----------
+    root            {str}       : Root directory of the sweep.
+    pattern         {str}       : Glob pattern of the log files relative to root. 
+                                  Default: "*/log.data"
+    observables     {callable}  : Module-level function returning a dict of 
+                                  observables given a Log. Default: sweep_observables
+    workers         {int}       : Number of processes. Default: None (all cores)
+    ignore_first    {int}       : Ignore equilibriation fixes. Default: 0
+    cache_dir       {str}       : Directory to cache the parsed logs in, see Log.
+                                  Default: None
+    
+    Returns:
+    --------
+    table           {dict}      : Column name -> array with one value per run. The 
+                                  "path" column holds the log files.
+    '''
+    import glob
+    from concurrent.futures import ProcessPoolExecutor
+    if observables is None:
+        observables = sweep_observables
+    filenames = sorted(glob.glob(os.path.join(root, pattern)))
+    if not filenames:
+        raise FileNotFoundError("No log files matching {} found in {}.".format(pattern, root))
+    tasks = [(filename, observables, ignore_first, cache_dir) for filename in filenames]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1:
+        rows = [_load_run(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(workers) as executor:
+            chunksize = max(1, len(tasks) // (4 * workers))
+            rows = list(executor.map(_load_run, tasks, chunksize=chunksize))
+    
+    names = []
+    for row in rows:
+        names += [name for name in row if name not in names]
+    table = {"path": np.array(filenames)}
+    for name in names:
+        table[name] = np.array([row.get(name, np.nan) for row in rows], dtype=float)
+    return table
+
+
+def sweep_observables(log):
+    '''
+    Default observables of a run in a sweep: final density, mean enthalpy
+    of every segment (enthalpy_0, enthalpy_1, ...), wall time, number of 
+    thermo rows, whether the run has finished, and the worst load 
+    imbalance, lowest CPU use and last speed of Log.performance_report.
+    At constant temperature, the enthalpy is averaged over the 
+    equilibrated part only, and the fraction of the segment left out is
+    given as equilibration_0, equilibration_1, ...
+    
+    Arguments:
+    ----------
+    log             {Log}       : Parsed log file.
+    '''
+    observables = {"rows": log.rows, "finished": float(log.finished), 
+                   "wall_time": log.wall_time}
+    report = [record for record in log.performance_report() if record]
+    if report:
+        observables["imbalance"] = max(record.get("imbalance", np.nan) for record in report)
+        observables["cpu_use"] = min(record.get("cpu_use", np.nan) for record in report)
+        observables["atom_steps_per_s"] = report[-1].get("atom_steps_per_s", np.nan)
+    for segment in reversed(log.segments):
+        if "Density" in segment.index and segment.array.shape[1]:
+            observables["final_density"] = segment.latest("Density")
+            break
+    for i, segment in enumerate(log.segments):
+        if "Enthalpy" in segment.index and segment.array.shape[1]:
+            enthalpy = segment.find("Enthalpy")
+            temperature = segment.temperature
+            if temperature is not None and temperature[0] == temperature[1]:
+                # Leave out the equilibration of constant temperature stages
+                start, details = segment.equilibration()
+                enthalpy = enthalpy[start:]
+                observables["equilibration_{}".format(i)] = start / segment.array.shape[1]
+            observables["enthalpy_{}".format(i)] = enthalpy.mean()
+    return observables
+
+
+def parse_run_name(name):
+    '''
+    Parameters encoded in a directory name like ZH0.5_theta100_B40_D0.15,
+    as a dict {"ZH": 0.5, "theta": 100.0, "B": 40.0, "D": 0.15}. Parts 
+    that are not a name followed by a number are skipped.
+    
+    Arguments:
+    ----------
+    name            {str}       : Directory name.
+    '''
+    import re
+    parameters = {}
+    for part in name.split("_"):
+        match = re.fullmatch(r"([A-Za-z]+)([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)", part)
+        if match:
+            parameters[match.group(1)] = float(match.group(2))
+    return parameters
+
+
+def _load_run(task):
+    ''' Parameters and observables of a single run, see load_sweep. '''
+    filename, observables, ignore_first, cache_dir = task
+    row = parse_run_name(os.path.basename(os.path.dirname(os.path.abspath(filename))))
+    try:
+        log = Log(filename, ignore_first, cache_dir=cache_dir)
+    except (OSError, ValueError):
+        return row                  # Unreadable log, observables are NaN
+    row.update(observables(log))
+    return row
+
+
+def _skin_suggestion(performance, record):
+    '''
+    Suggested change of the neighbor skin of a run. Dangerous builds mean
+    atoms moved further than half the skin between builds, and frequent 
+    builds that take a large share of the time are cheaper with a larger
+    skin. If builds are rare and cheap, a smaller skin reduces the number
+    of pairs the force computation has to skip.
+    '''
+    if performance.get("dangerous_builds", 0) > 0:
+        return "increase"
+    if "steps_per_build" not in record or "neigh_share" not in record:
+        return "keep"
+    if record["steps_per_build"] < 10 and record["neigh_share"] > 0.1:
+        return "increase"
+    if record["steps_per_build"] > 50 and record["neigh_share"] < 0.02:
+        return "decrease"
+    return "keep"
+
+
+class RunningStatistics:
+    '''
+    Streaming mean and standard error of several series at once, by 
+    block averaging (Flyvbjerg and Petersen, 1989). Samples can be added
+    in batches of any size. Every blocking level keeps Welford-style 
+    running moments of its block means, merged batch-wise, and passes
+    the averages of pairs on to the next level, such that memory does not
+    grow with the length of the series. The level with a reliable error
+    is chosen by the criterion of Lee et al. (2011): B^3 > 2 N 
+    (error_B / error_1)^4 for blocks of size B.
+    '''
+    def __init__(self):
+        self.count = []
+        self.mean = []
+        self.m2 = []
+        self._pending = []
+
+    def update(self, array):
+        '''
+        Add samples, one row per series.
+        
+        Arguments:
+        ----------
+        array           {ndarray}   : Samples, series x samples
+        '''
+        values = np.asarray(array, dtype=float)
+        level = 0
+        while values.shape[1]:
+            if level == len(self.count):
+                self.count.append(0)
+                self.mean.append(np.zeros(len(values)))
+                self.m2.append(np.zeros(len(values)))
+                self._pending.append(values[:, :0])
+            # Chan et al. merge of the moments of the batch into the level
+            n = values.shape[1]
+            mean = values.mean(axis=1)
+            m2 = ((values - mean[:, None])**2).sum(axis=1)
+            total = self.count[level] + n
+            delta = mean - self.mean[level]
+            self.mean[level] = self.mean[level] + delta * n / total
+            self.m2[level] = self.m2[level] + m2 + delta**2 * self.count[level] * n / total
+            self.count[level] = total
+            # Pair up the block means for the next level
+            values = np.concatenate((self._pending[level], values), axis=1)
+            even = values.shape[1] - values.shape[1] % 2
+            self._pending[level] = values[:, even:]
+            values = 0.5 * (values[:, 0:even:2] + values[:, 1:even:2])
+            level += 1
+
+    def errors(self):
+        ''' Standard error estimated at every blocking level, series x levels. '''
+        count = np.array(self.count, dtype=float)
+        m2 = np.array(self.m2).T
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.sqrt(m2 / (count - 1) / count)
+
+    def result(self):
+        '''
+        Returns:
+        --------
+        mean            {ndarray}   : Mean of every series
+        error           {ndarray}   : Standard error of the mean of every series
+        level           {ndarray}   : Blocking level used, blocks of 2^level samples
+        '''
+        if not self.count or self.count[0] < 2:
+            raise ValueError("At least two samples are needed.")
+        errors = self.errors()
+        levels = np.arange(errors.shape[1])
+        usable = np.array(self.count) >= 2
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = errors / errors[:, :1]
+            reliable = (2.0**levels)**3 > 2 * self.count[0] * ratio**4
+        reliable &= usable
+        last = levels[usable][-1]
+        level = np.where(reliable.any(axis=1), np.argmax(reliable, axis=1), last)
+        error = errors[np.arange(len(errors)), level]
+        error[~np.isfinite(error)] = 0      # Constant series
+        return self.mean[0].copy(), error, level
+
+
+def statistical_inefficiency(series, lengths=None):
+    '''
+    Statistical inefficiency g = 1 + 2 sum_t (1 - t/N) C(t) of time 
+    series, the number of correlated samples per uncorrelated one. The 
+    normalized autocorrelation C(t) of all series is computed at once by 
+    zero-padded FFTs, and the sum is truncated where C(t) first drops to
+    zero or below.
+    
+    Arguments:
+    ----------
+    series          {ndarray}   : One series per row, or a single series
+    lengths         {ndarray}   : Length of every row, the rest of the row is 
+                                  ignored. Default: None (whole rows)
+    
+    Returns:
+    --------
+    g               {ndarray}   : Statistical inefficiency of every row, at least 1,
+                                  a float for a single series
+    '''
+    single = np.ndim(series) == 1
+    series = np.atleast_2d(np.asarray(series, dtype=float))
+    rows, T = series.shape
+    lengths = np.full(rows, T) if lengths is None else np.asarray(lengths)
+    valid = np.arange(T) < lengths[:, None]
+    means = np.where(valid, series, 0).sum(axis=1) / lengths
+    centered = np.where(valid, series - means[:, None], 0)
+    F = np.fft.rfft(centered, n=2*T, axis=1)
+    autocov = np.fft.irfft(F.real**2 + F.imag**2, n=2*T, axis=1)[:, :T]
+    lag = np.arange(T)
+    pairs = np.maximum(lengths[:, None] - lag, 1)
+    variance = autocov[:, 0] / lengths
+    # Series constant up to round-off have no correlation time
+    constant = variance <= (1e-10 * means)**2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        C = autocov / pairs / variance[:, None]
+    # Sum up to the first lag where C is not positive
+    C = np.where(lag < lengths[:, None], C, 0)[:, 1:]
+    keep = np.cumprod(C > 0, axis=1, dtype=bool)
+    weights = 1 - lag[1:] / lengths[:, None]
+    g = 1 + 2 * np.sum(np.where(keep, weights * C, 0), axis=1)
+    g[constant | ~np.isfinite(g)] = 1
+    g = np.maximum(g, 1)
+    return g[0] if single else g
+
+
+def detect_equilibration(series, candidates=50, keep=0.25, samples=2**14, memory=2**26):
+    '''
+    Detect the equilibrated part of a time series (Chodera, 2016): the
+    start t0 maximizing the effective number of uncorrelated samples 
+    (T - t0) / g(t0), where g is the statistical inefficiency of the 
+    remaining series. The statistical inefficiency of the candidate 
+    starts is computed in batches that fit the memory budget, see 
+    statistical_inefficiency. Long series are first averaged in blocks
+    down to at most the given number of samples to choose the start, 
+    the statistical inefficiency from there is then computed on the 
+    full series.
+    
+    Arguments:
+    ----------
+    series          {ndarray}   : Time series
+    candidates      {int}       : Number of evenly spaced start points tried. 
+                                  Default: 50
+    keep            {float}     : Smallest fraction of the series kept. Default: 0.25
+    samples         {int}       : Largest number of (block averaged) samples used to
+                                  choose the start. Default: 16384
+    memory          {int}       : Memory budget in bytes. Default: 64 MiB
+    
+    Returns:
+    --------
+    start           {int}       : First equilibrated index
+    g               {float}     : Statistical inefficiency from start
+    neff            {float}     : Effective number of uncorrelated samples from start
+    '''
+    series = np.asarray(series, dtype=float)
+    block = -(-len(series) // samples)
+    if block > 1:
+        start = detect_equilibration(_block_average(series, block), candidates, keep,
+                                     samples, memory)[0] * block
+        g = statistical_inefficiency(series[start:])
+        return start, float(g), float((len(series) - start) / g)
+    T = len(series)
+    starts = np.unique(np.linspace(0, int(T * (1 - keep)), candidates).astype(int))
+    lengths = T - starts
+    # Every row takes about a hundred bytes per sample in the FFTs
+    batch = max(1, memory // (100 * T))
+    g = np.empty(len(starts))
+    for first in range(0, len(starts), batch):
+        rows = slice(first, first + batch)
+        # Row k holds the series from starts[k], shifted to the beginning
+        index = np.minimum(starts[rows, None] + np.arange(T), T - 1)
+        g[rows] = statistical_inefficiency(series[index], lengths[rows])
+    neff = lengths / g
+    best = int(np.argmax(neff))
+    return int(starts[best]), float(g[best]), float(neff[best])
+
+
+def _block_average(series, block):
+    ''' Means of consecutive blocks of a series, the last one possibly shorter. '''
+    edges = np.arange(0, len(series), block)
+    return np.add.reduceat(series, edges) / np.diff(np.append(edges, len(series)))
+
+
+def change_point(x, y, smooth=None, method="changepoint", margin=0.05, significance=5.0):
+    '''
+    Locate a phase transition in a curve y(x), e.g. the density or the 
+    enthalpy against the temperature of a heat ramp. With the change 
+    point method, the split minimizing the squared error of separate 
+    straight lines on either side is found for all splits at once from 
+    cumulative sums. With the derivative method, the transition is where
+    the smoothed curve changes fastest.
+    
+    Arguments:
+    ----------
+    x               {ndarray}   : E.g. temperature
+    y               {ndarray}   : E.g. density or enthalpy
+    smooth          {int}       : Width of a centered running average applied to
+                                  y first. Default: None (1% of the points for 
+                                  the derivative method, else no smoothing)
+    method          {str}       : "changepoint" or "derivative". Default: "changepoint"
+    margin          {float}     : Fraction of points at either end that cannot be
+                                  the transition. Default: 0.05
+    significance    {float}     : The jump has to exceed the standard deviation of 
+                                  y around the straight lines by this factor, else no
+                                  transition is found. Default: 5
+    
+    Returns:
+    --------
+    index           {int}       : Index of the transition, None if there are too 
+                                  few points or no significant jump
+    jump            {float}     : Difference between the straight lines fitted 
+                                  after and before the transition, at the transition
+    '''
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    m = max(2, int(margin * n))
+    if n < 2 * m + 1:
+        return None, np.nan
+    if smooth is None and method == "derivative":
+        smooth = max(3, n // 100)
+    if smooth is not None and smooth > 1:
+        y = _centered_average(y, smooth)
+    if method == "changepoint":
+        def sums(x, y):
+            return [np.concatenate(([0], np.cumsum(v))) for v in (np.ones_like(x), x, y, x*x, x*y, y*y)]
+        
+        def sse(c, sx, sy, sxx, sxy, syy):
+            vxx = sxx - sx**2 / c
+            vxy = sxy - sx * sy / c
+            with np.errstate(divide="ignore", invalid="ignore"):
+                error = syy - sy**2 / c - np.where(vxx > 0, vxy**2 / vxx, 0)
+            return error
+        
+        splits = np.arange(m, n - m + 1)
+        prefix = sums(x, y)
+        left = sse(*[v[splits] for v in prefix])
+        right = sse(*[v[-1] - v[splits] for v in prefix])
+        index = int(splits[np.argmin(left + right)])
+    elif method == "derivative":
+        with np.errstate(divide="ignore", invalid="ignore"):
+            slope = np.gradient(y, x)
+        slope[~np.isfinite(slope)] = 0
+        # The direction of the transition is given by the overall change
+        slope *= (np.sign(y[-m:].mean() - y[:m].mean()) or 1) * (np.sign(x[-1] - x[0]) or 1)
+        index = int(m + np.argmax(slope[m:n - m]))
+    else:
+        raise KeyError("No method named {} found.".format(method))
+    before = np.polyfit(x[:index], y[:index], 1)
+    after = np.polyfit(x[index:], y[index:], 1)
+    jump = np.polyval(after, x[index]) - np.polyval(before, x[index])
+    residual = np.concatenate((y[:index] - np.polyval(before, x[:index]),
+                               y[index:] - np.polyval(after, x[index:])))
+    if abs(jump) <= significance * residual.std():
+        return None, jump
+    return index, jump
+
+
+def _centered_average(y, window):
+    ''' Centered running average, averaging over fewer points at the ends. '''
+    total = np.concatenate(([0], np.cumsum(y)))
+    half = window // 2
+    index = np.arange(len(y))
+    lo = np.maximum(index - half, 0)
+    hi = np.minimum(index + half + 1, len(y))
+    return (total[hi] - total[lo]) / (hi - lo)
+
+
+def boiling_point(log, quantity="Density", smooth=None, method="changepoint"):
+    '''
+    Estimate the liquid-vapour transition from the heat ramp and the 
+    cool-down of a log file (see Log.ramps), by locating the transition 
+    in the quantity against the ramped thermostat temperature (see 
+    change_point). The enthalpy of vaporization is the jump of the 
+    enthalpy at the boiling point of the heat ramp, and the hysteresis 
+    is the boiling point minus the condensation point.
+    
+    Arguments:
+    ----------
+    log             {Log}       : Parsed log file
+    quantity        {str}       : Thermo column to locate the transition in. 
+                                  Default: "Density"
+    smooth          {int}       : Width of the running average, see change_point
+    method          {str}       : "changepoint" or "derivative". Default: "changepoint"
+    
+    Returns:
+    --------
+    results         {dict}      : "boiling" and "condensation" temperature, 
+                                  "hysteresis", "enthalpy" of vaporization of the
+                                  whole system in energy units and "jump" of the
+                                  quantity at the most likely transition of the heat
+                                  ramp. NaN if not found
+    '''
+    heating, cooling = log.ramps()
+    results = {"boiling": np.nan, "condensation": np.nan, "hysteresis": np.nan, 
+               "enthalpy": np.nan, "jump": np.nan}
+    if heating is not None:
+        temperature = heating.target_temperature()
+        index, jump = change_point(temperature, heating.find(quantity), smooth, method)
+        results["jump"] = jump
+        if index is not None:
+            results["boiling"] = temperature[index]
+            if "Enthalpy" in heating.index:
+                before = np.polyfit(temperature[:index], heating.find("Enthalpy")[:index], 1)
+                after = np.polyfit(temperature[index:], heating.find("Enthalpy")[index:], 1)
+                results["enthalpy"] = (np.polyval(after, temperature[index]) 
+                                       - np.polyval(before, temperature[index]))
+    if cooling is not None:
+        temperature = cooling.target_temperature()
+        index, jump = change_point(temperature, cooling.find(quantity), smooth, method)
+        if index is not None:
+            results["condensation"] = temperature[index]
+    results["hysteresis"] = results["boiling"] - results["condensation"]
+    return results
+
+
+def npt_fluctuations(segment, mass=None, equilibrated=True):
+    '''
+    Heat capacity, isothermal compressibility and thermal expansion 
+    coefficient from the fluctuations of the enthalpy H and volume V in 
+    an NPT segment in metal units:
+        Cp      = <dH^2> / (k T^2)
+        kappa_T = <dV^2> / (k T <V>)
+        alpha_P = <dV dH> / (k T^2 <V>)
+    The errors follow from block averaging the squared fluctuations and 
+    the volume (see RunningStatistics). The volume is taken from the 
+    Volume column if present, otherwise from the density (g/cm^3) and 
+    the total mass. The enthalpy is H = E + P V with the pressure of the
+    barostat, as the Enthalpy column uses the instantaneous pressure, 
+    whose fluctuations would dominate Cp.
+    
+    Arguments:
+    ----------
+    segment         {Segment}   : NPT segment at constant temperature
+    mass            {float}     : Total mass of the system in g/mol, needed if 
+                                  there is no Volume column. Default: None
+    equilibrated    {bool}      : Leave out the rows before equilibration, see
+                                  Segment.equilibration. Default: True
+    
+    Returns:
+    --------
+    results         {dict}      : "Cp" in eV/K, "kappa_T" in 1/bar and "alpha_P" in
+                                  1/K, the same in SI units with suffix "_si" (J/K, 
+                                  1/Pa, 1/K), "cp_si" in J/(kg K) if the mass is 
+                                  known, and the standard errors with suffix "_err"
+    '''
+    start = segment.equilibration()[0] if equilibrated else 0
+    enthalpy = segment.find("Enthalpy")[start:]
+    if "Volume" in segment.index:
+        volume = segment.find("Volume")[start:]
+    elif mass is not None:
+        volume = mass * AMU_G / segment.find("Density")[start:] * 1e24
+    else:
+        raise ValueError("No Volume column, give the total mass to use the density.")
+    pressure = segment.pressure
+    if "TotEng" in segment.index and pressure is not None:
+        pressure = 0.5 * (pressure[0] + pressure[1])
+        enthalpy = segment.find("TotEng")[start:] + pressure * volume / EV_A3_BAR
+    temperature = segment.temperature
+    if temperature is None or temperature[0] != temperature[1]:
+        temperature = segment.find("Temp")[start:].mean()
+    else:
+        temperature = temperature[0]
+    if len(enthalpy) < 2:
+        raise ValueError("At least two rows are needed.")
+    
+    dH = enthalpy - enthalpy.mean()
+    dV = volume - volume.mean()
+    blocks = RunningStatistics()
+    blocks.update(np.vstack((dH * dH, dV * dV, dV * dH, volume)))
+    (varH, varV, covVH, V), (varH_err, varV_err, covVH_err, V_err), level = blocks.result()
+    kT = UNITS["metal"]["boltz"] * temperature
+    Cp = varH / (kT * temperature)
+    kappa = varV / (kT * V)                 # A^3/eV
+    alpha = covVH / (kT * temperature * V)
+    results = {"Cp": Cp, "Cp_err": varH_err / (kT * temperature),
+               "kappa_T": kappa / EV_A3_BAR, 
+               "kappa_T_err": abs(kappa) * np.hypot(varV_err / varV, V_err / V) / EV_A3_BAR,
+               "alpha_P": alpha, 
+               "alpha_P_err": abs(alpha) * np.hypot(covVH_err / covVH, V_err / V)}
+    results["Cp_si"] = results["Cp"] * EV_J
+    results["Cp_si_err"] = results["Cp_err"] * EV_J
+    results["kappa_T_si"] = results["kappa_T"] / 1e5
+    results["kappa_T_si_err"] = results["kappa_T_err"] / 1e5
+    results["alpha_P_si"] = results["alpha_P"]
+    results["alpha_P_si_err"] = results["alpha_P_err"]
+    if mass is not None:
+        results["cp_si"] = results["Cp_si"] / (mass * AMU_G * 1e-3)
+        results["cp_si_err"] = results["Cp_si_err"] / (mass * AMU_G * 1e-3)
+    return results
+
+
+# Physical constants for metal units
+AMU_G = 1.66053906660e-24         # g
+EV_J = 1.602176634e-19            # J
+EV_A3_BAR = 1.602176634e6         # 1 eV/A^3 in bar
+
+
+class Autocorrelation:
+    '''
+    Autocorrelation functions of long, equally spaced series, averaged 
+    over all time origins and streamed in chunks. Every chunk of samples 
+    is correlated with itself and the next lags samples by a zero-padded 
+    FFT, so the result is exact, while only a chunk plus lags samples 
+    are transformed at a time. The mean of the series is subtracted 
+    afterwards from the head and tail sums, such that samples can be 
+    added before the mean is known.
+    '''
+    def __init__(self, lags, chunk=2**16):
+        '''
+        Arguments:
+        ----------
+        lags            {int}       : Number of lags, 0, 1, ..., lags-1 samples
+        chunk           {int}       : Time origins per FFT. Default: 65536
+        '''
+        self.lags = lags
+        self.chunk = max(chunk, lags)
+        self.samples = 0
+        self._shift = None
+        self._head = None
+        self._buffer = None
+        self._sum = None
+        self._products = None
+
+    def update(self, array):
+        '''
+        Add samples, one row per series.
+        
+        Arguments:
+        ----------
+        array           {ndarray}   : Samples, series x samples
+        '''
+        values = np.atleast_2d(np.asarray(array, dtype=float))
+        if not values.shape[1]:
+            return
+        if self._shift is None:
+            # Shift by a first guess of the mean to avoid round-off in the products
+            self._shift = values.mean(axis=1, keepdims=True)
+            self._head = values[:, :0]
+            self._buffer = values[:, :0]
+            self._sum = np.zeros(len(values))
+            self._products = np.zeros((len(values), self.lags))
+        values = values - self._shift
+        if self._head.shape[1] < self.lags:
+            self._head = np.hstack((self._head, values[:, :self.lags - self._head.shape[1]]))
+        self._sum += values.sum(axis=1)
+        self.samples += values.shape[1]
+        self._buffer = np.hstack((self._buffer, values))
+        # Origins of a chunk need the samples up to lags-1 after it
+        while self._buffer.shape[1] >= self.chunk + self.lags:
+            self._correlate(self._buffer[:, :self.chunk], self._buffer[:, :self.chunk + self.lags])
+            self._buffer = self._buffer[:, self.chunk:]
+
+    def _correlate(self, origins, values):
+        ''' Add sum_t origins(t) values(t+m) for the lags m. '''
+        n = 1 << int(np.ceil(np.log2(origins.shape[1] + self.lags)))
+        product = np.conj(np.fft.rfft(origins, n=n)) * np.fft.rfft(values, n=n)
+        lags = min(self.lags, values.shape[1])
+        self._products[:, :lags] += np.fft.irfft(product, n=n)[:, :lags]
+
+    def result(self):
+        '''
+        Returns:
+        --------
+        acf             {ndarray}   : Autocovariance of every series at lags 0, 1, ...,
+                                      series x min(lags, samples)
+        '''
+        if self.samples < 2:
+            raise ValueError("At least two samples are needed.")
+        lags = min(self.lags, self.samples)
+        tail = self._buffer[:, self._buffer.shape[1] - lags:]
+        if self._buffer.shape[1]:
+            self._correlate(self._buffer, self._buffer)
+            self._buffer = self._buffer[:, :0]
+        # sum_t (x(t) - mu) (x(t+m) - mu) from sum_t x(t) x(t+m) and the end sums
+        origins = self.samples - np.arange(lags)
+        mean = (self._sum / self.samples)[:, None]
+        head = np.hstack((np.zeros((len(mean), 1)), np.cumsum(self._head[:, :lags - 1], axis=1)))
+        tail = np.hstack((np.zeros((len(mean), 1)), np.cumsum(tail[:, :0:-1], axis=1)))
+        products = (self._products[:, :lags] - mean * (2 * self._sum[:, None] - head - tail) 
+                    + origins * mean**2)
+        return products / origins
+
+
+def green_kubo(segment, quantity="viscosity", tmax=5.0, mass=None, equilibrated=True, 
+               chunk=2**16):
+    '''
+    Viscosity or thermal conductivity by the Green-Kubo relations in metal
+    units, from the pressure tensor or heat flux columns of the thermo 
+    output (see AutoSim.simulate with stress=True or heat_flux=True):
+        eta     = V / (k T)   int <P_ab(0) P_ab(t)> dt,   ab = xy, xz, yz
+        kappa   = 1 / (V k T^2) int <J_a(0) J_a(t)> dt,   a = x, y, z
+    with the heat flux J of compute heat/flux (energy times velocity). 
+    The flux is built from compute stress/atom, which is only approximate
+    for many-body potentials like Vashishta, so the thermal conductivity
+    is an estimate, while the viscosity is exact.
+    The autocorrelation functions are averaged over all time origins, 
+    streamed in chunks (see Autocorrelation), so that series of millions 
+    of rows are handled in bounded memory. The running integral is cut 
+    off where the mean autocorrelation first crosses zero, and the 
+    plateau is the average of the integral from there to twice the 
+    cutoff. The error is the standard error of the plateaus of the 
+    independent components.
+    
+    Arguments:
+    ----------
+    segment         {Segment}   : Segment at a constant temperature, NVT or NPT
+    quantity        {str}       : "viscosity" or "thermal_conductivity". 
+                                  Default: "viscosity"
+    tmax            {float}     : Longest correlation time in ps. Default: 5
+    mass            {float}     : Total mass of the system in g/mol, needed if 
+                                  there is no Volume column. Default: None
+    equilibrated    {bool}      : Leave out the rows before equilibration, see
+                                  Segment.equilibration. Default: True
+    chunk           {int}       : Time origins per FFT. Default: 65536
+    
+    Returns:
+    --------
+    results         {dict}      : "value" and "error" in Pa s (viscosity) or 
+                                  W/(m K) (thermal conductivity), "components" 
+                                  with the plateau of every component, "cutoff" 
+                                  in ps, "converged" (whether the autocorrelation 
+                                  crossed zero before tmax), "time" in ps, "acf" 
+                                  (mean autocorrelation in bar^2 or (eV A/ps)^2) 
+                                  and "integral" (running integral in SI units)
+    '''
+    columns = GREEN_KUBO_COLUMNS.get(quantity)
+    if columns is None:
+        raise KeyError("No quantity named {} found.".format(quantity))
+    for key in columns:
+        if key not in segment.index:
+            raise KeyError("No category named {} found.".format(key))
+    start = segment.equilibration()[0] if equilibrated else 0
+    if segment.array.shape[1] - start < 2:
+        raise ValueError("At least two rows are needed.")
+    
+    if "Time" in segment.index:
+        spacing = np.diff(segment.find("Time")[start:])
+    else:
+        spacing = np.diff(segment.find("Step")[start:]) * segment.timestep
+    dt = spacing.mean()
+    if not np.allclose(spacing, dt, rtol=1e-3):
+        raise ValueError("The thermo rows are not equally spaced in time.")
+    if "Volume" in segment.index:
+        volume = segment.find("Volume")[start:].mean()
+    elif mass is not None:
+        volume = (mass * AMU_G / segment.find("Density")[start:] * 1e24).mean()
+    else:
+        raise ValueError("No Volume column, give the total mass to use the density.")
+    temperature = segment.temperature
+    if temperature is None or temperature[0] != temperature[1]:
+        temperature = segment.find("Temp")[start:].mean()
+    else:
+        temperature = temperature[0]
+    
+    correlation = Autocorrelation(int(round(tmax / dt)) + 1, chunk)
+    series = segment.array[[segment.index[key] for key in columns]]
+    for first in range(start, series.shape[1], correlation.chunk):
+        correlation.update(series[:, first:first + correlation.chunk])
+    acf = correlation.result()
+    kT = UNITS["metal"]["boltz"] * temperature
+    if quantity == "viscosity":
+        prefactor = volume / kT * BAR2_A3_PS_EV_PAS
+    else:
+        prefactor = 1 / (volume * kT * temperature) * EV_A_PS_KAPPA
+    integral = prefactor * dt * (np.cumsum(acf, axis=1) - 0.5 * (acf[:, :1] + acf))
+    
+    mean = acf.mean(axis=0)
+    crossing = np.flatnonzero(mean[1:] <= 0)
+    converged = len(crossing) > 0
+    cutoff = crossing[0] + 1 if converged else len(mean) - 1
+    components = integral[:, cutoff:min(2 * cutoff, len(mean) - 1) + 1].mean(axis=1)
+    return {"value": components.mean(), 
+            "error": components.std(ddof=1) / np.sqrt(len(components)),
+            "components": components, "cutoff": cutoff * dt, "converged": converged,
+            "time": dt * np.arange(len(mean)), "acf": mean, 
+            "integral": integral.mean(axis=0)}
+
+
+# Thermo columns of the Green-Kubo relations, see AutoSim.simulate
+GREEN_KUBO_COLUMNS = {"viscosity": ("Pxy", "Pxz", "Pyz"),
+                      "thermal_conductivity": ("c_flux[1]", "c_flux[2]", "c_flux[3]")}
+BAR2_A3_PS_EV_PAS = 1e-32 / 1.602176634e-19     # bar^2 A^3 ps / eV in Pa s
+EV_A_PS_KAPPA = 1.602176634e-19 * 1e22          # eV / (A ps K) in W / (m K)
+
+
+def boiling_observables(log):
+    ''' Observables of a run for load_sweep, see sweep_observables and boiling_point. '''
+    observables = sweep_observables(log)
+    observables.update(boiling_point(log))
+    return observables
+
+
+def _log_cache_file(filename, cache_dir=None):
+    ''' Filename of the parsed-log cache, named by the absolute path of the log. '''
+    if cache_dir is None:
+        return filename + ".cache.npz"
+    os.makedirs(cache_dir, exist_ok=True)
+    key = hashlib.sha1(os.path.abspath(filename).encode()).hexdigest()
+    return os.path.join(cache_dir, key + ".npz")
+
+
+def _evict_log_cache(cache_dir, size, keep=None):
+    '''
+    Remove the least recently used parsed logs until the cache directory
+    is below the size limit. The most recent entry is always kept.
+    
+    Arguments:
+    ----------
+    cache_dir       {str}   : Cache directory.
+    size            {int}   : Size limit in bytes.
+    keep            {str}   : Cache file that is not removed. Default: None
+    '''
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith(".npz") and entry.is_file():
+            stat = entry.stat()
+            entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+    total = sum(entry[1] for entry in entries)
+    for mtime, nbytes, path in sorted(entries):
+        if total <= size:
+            break
+        if keep is not None and os.path.abspath(path) == os.path.abspath(keep):
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass                    # Evicted by another process
+        total -= nbytes
+
+
+def _parse_thermo_block(lines, variables):
+    '''
+    Convert the lines of a thermo block in bulk. Lines that are not 
+    complete rows of numbers (warnings, or a partially written last line
+    of a running simulation) are skipped. Returns an array with one row 
+    per variable, such that each variable is a contiguous view.
+    
+    Arguments:
+    ----------
+    lines           {list(str)} : Lines of the thermo block
+    variables       {list(str)} : Names of the thermo columns
+    '''
+    if lines and not lines[-1].endswith("\n"):
+        lines = lines[:-1]
+    if not lines:
+        return np.empty((len(variables), 0))
+    try:
+        array = np.loadtxt(lines, ndmin=2)
+    except ValueError:
+        rows = []
+        for line in lines:
+            strings = line.split()
+            if len(strings) != len(variables):
+                continue
+            try:
+                rows.append([float(string) for string in strings])
+            except ValueError:
+                continue
+        array = np.asarray(rows, dtype=float).reshape(-1, len(variables))
+    return np.ascontiguousarray(array.T)